@@ -0,0 +1,289 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.exceptions import NotFoundError, RequestError
+from rac_es.documents import Collection
+from rest_framework.exceptions import MethodNotAllowed, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.viewsets import ViewSetMixin
+
+from argo import settings
+
+from .instrumentation import InstrumentedAIOHttpConnection
+from .serializers import ReferenceSerializer
+from .view_helpers import ChildrenPaginator
+from .views import (OBJECT_DATA_FIELDS, CollectionViewSet, MyListView,
+                    ObjectViewSet)
+
+loop_client = None
+
+
+def get_async_client():
+    """Returns an `AsyncElasticsearch` client for the running event loop.
+
+    Connections belong to the event loop which opened them, so the client is
+    replaced if it was created in a different loop.
+    """
+    global loop_client
+    loop = asyncio.get_running_loop()
+    if loop_client is None or loop_client[0] is not loop:
+        loop_client = (loop, AsyncElasticsearch(
+            settings.ELASTICSEARCH_DSL["default"]["hosts"],
+            connection_class=InstrumentedAIOHttpConnection,
+            maxsize=settings.ELASTICSEARCH_ASYNC_CONNECTIONS))
+    return loop_client[1]
+
+
+async def render_response(response):
+    """Returns a rendered DRF response as an `HttpResponse`.
+
+    Django renders responses in a single thread shared by all requests, so
+    JSON responses are rendered in the event loop instead. Other formats,
+    such as the browsable API, may use the database and are rendered in that
+    thread.
+    """
+    if not isinstance(response, Response):
+        return response
+    if isinstance(response.accepted_renderer, JSONRenderer):
+        response.render()
+    else:
+        await sync_to_async(response.render)()
+    rendered = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        rendered[header] = value
+    return rendered
+
+
+class AsyncViewMixin:
+    """Handles requests with async versions of view actions.
+
+    Async actions are named after the action they replace, prefixed with
+    `async_`, and make Elasticsearch requests with an `AsyncElasticsearch`
+    client, so independent requests can be made concurrently. Queries are
+    built and responses are serialized by the methods of the sync view.
+    """
+
+    def get_index_generation(self):
+        """Returns the index generation read when the view was created, so it is not read in the event loop."""
+        return self.index_generation
+
+    @classmethod
+    def as_async_view(cls, actions, **initkwargs):
+        """Returns an async view function which handles the methods in `actions` with async actions.
+
+        Other methods, such as OPTIONS, are handled by the sync view in a thread.
+        """
+        actions = dict(actions)
+        if "get" in actions and "head" not in actions:
+            actions["head"] = actions["get"]
+        if issubclass(cls, ViewSetMixin):
+            sync_view = cls.as_view(actions, **initkwargs)
+        else:
+            sync_view = cls.as_view(**initkwargs)
+
+        def create_view():
+            # index checks and generations are cached, but may need a request to Elasticsearch
+            self = cls(**initkwargs)
+            self.index_generation = super(AsyncViewMixin, self).get_index_generation()
+            return self
+
+        async def view(request, *args, **kwargs):
+            if request.method.lower() not in actions:
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+            self = await sync_to_async(create_view, thread_sensitive=False)()
+            self.action_map = actions
+            self.async_client = get_async_client()
+            return await self.async_dispatch(request, *args, **kwargs)
+
+        # used by metrics to label requests in the same way as the sync view
+        view.cls = cls
+        view.initkwargs = initkwargs
+        view.actions = actions
+        view.csrf_exempt = True
+        return view
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        """Handles a request in the same way as `APIView.dispatch`.
+
+        Requests are not authenticated, because authentication uses the
+        database and these views allow any user.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            self.format_kwarg = self.get_format_suffix(**kwargs)
+            request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+            self.check_permissions(request)
+            self.check_throttles(request)
+            if hasattr(self, "check_etag"):
+                self.etag = self.check_etag(request)
+            self.action = self.action_map.get(request.method.lower())
+            handler = getattr(self, "async_{}".format(self.action), None)
+            if handler is None:
+                raise MethodNotAllowed(request.method)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return await render_response(self.response)
+
+    async def async_resolve_object(self, object_type, identifier, source_fields=None, source_excludes=None, raw=False):
+        """Returns an object based on object type and identifier, like `resolve_object`."""
+        doc = await self.async_client.get(
+            index=object_type._index._name,
+            id=identifier,
+            ignore=404,
+            **self.get_source_params(object_type, source_fields, source_excludes))
+        resolved = self.get_resolved_hit(object_type, doc, source_fields, raw)
+        if resolved is None:
+            raise Http404("No object matches the given query.")
+        return resolved
+
+    async def async_resolve_objects(self, object_type, identifiers, source_fields=None, source_excludes=None, raw=False):
+        """Returns a list of objects based on object type and identifiers, like `resolve_objects`."""
+        if not identifiers:
+            return []
+        docs = (await self.async_client.mget(
+            index=object_type._index._name,
+            body={"ids": list(identifiers)},
+            **self.get_source_params(object_type, source_fields, source_excludes)))["docs"]
+        return [self.get_resolved_hit(object_type, doc, source_fields, raw) for doc in docs]
+
+
+class AsyncDocumentMixin(AsyncViewMixin):
+    """Provides async versions of `DocumentViewSet` methods which make Elasticsearch requests."""
+
+    async def async_get_objects_data(self, object_type, identifiers):
+        """Gets additional data from a list of objects, like `get_objects_data`."""
+        keys, cached, missing = self.get_cached_objects_data(object_type, identifiers)
+        resolved = await self.async_resolve_objects(object_type, missing, source_fields=OBJECT_DATA_FIELDS, raw=True)
+        return self.cache_objects_data(identifiers, keys, cached, dict(zip(missing, resolved)))
+
+    async def async_get_batched_hit_counts(self, uris, base_query):
+        """Gets hit counts for a list of components, like `get_batched_hit_counts`.
+
+        Returns None if the request has no parameters, in which case hit counts
+        are not added to responses.
+        """
+        if not len(self.request.GET):
+            return None
+        batch = self.get_hit_count_batch(uris, base_query)
+        if batch is None:
+            return [(None, None) for uri in uris]
+        counts = await batch.async_counts(self.async_client)
+        return list(zip(counts[::2], counts[1::2]))
+
+    async def async_get_ancestors_data(self, ancestors, base_query):
+        """Returns a tuple of data and hit counts for a list of ancestors, fetched concurrently."""
+        identifiers = [a["identifier"] for a in ancestors]
+        return await asyncio.gather(
+            self.async_get_objects_data(Collection, identifiers),
+            self.async_get_batched_hit_counts(identifiers, base_query))
+
+    async def async_ancestors(self, request, pk=None):
+        """Returns the ancestors of a collection or object, like `ancestors`.
+
+        Hit counts for ancestors are fetched concurrently with their data.
+        """
+        base_query = self.search.query()
+        obj = await self.async_resolve_object(self.document, pk, source_fields=["ancestors"], raw=True)
+        ancestors = list(obj["_source"].get("ancestors", []))
+        ancestors_data, hit_counts = await self.async_get_ancestors_data(ancestors, base_query)
+        if ancestors:
+            if ancestors_data[-1] is None:
+                raise Http404("No object matches the given query.")
+            if ancestors_data[-1]["ancestors"]:
+                resource_ancestors = [dict(a) for a in ancestors_data[-1]["ancestors"]]
+                resource_data, resource_hit_counts = await self.async_get_ancestors_data(resource_ancestors, base_query)
+                ancestors += resource_ancestors
+                ancestors_data += resource_data
+                if hit_counts is not None:
+                    hit_counts += resource_hit_counts
+        return Response(self.serialize_ancestors(ancestors, ancestors_data, hit_counts))
+
+
+class AsyncChildrenPaginator(ChildrenPaginator):
+    """Paginates children with an `AsyncElasticsearch` client."""
+
+    async def async_paginate_queryset(self, queryset, request, client):
+        """Returns a page of raw child hits, like `paginate_queryset`.
+
+        Limit/offset pages are fetched with a single search which also counts
+        all children.
+        """
+        if self.use_cursor(request):
+            pit_id, search_after = self.init_search_after(request)
+            from_cursor = pit_id is not None
+            if not from_cursor:
+                pit_id = (await client.open_point_in_time(index=queryset._index, keep_alive=self.keep_alive))["id"]
+            search = self.get_search_after_search(queryset, pit_id, search_after)
+            try:
+                resp = await client.search(body=search.to_dict(), **search._params)
+            except (NotFoundError, RequestError):
+                if not from_cursor:
+                    raise
+                raise NotFound(self.invalid_cursor_message)
+            page = self.get_search_after_page(search, resp)
+            if self.next_cursor is None:
+                await client.close_point_in_time(body={"id": resp["pit_id"]}, ignore=404)
+            return page
+        self.init_limit_offset(request)
+        search = queryset[self.offset:self.offset + self.limit].extra(track_total_hits=True)
+        resp = await client.search(index=search._index, body=search.to_dict(), **search._params)
+        self.count = resp["hits"]["total"]["value"]
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return resp["hits"]["hits"]
+
+
+class AsyncCollectionViewSet(AsyncDocumentMixin, CollectionViewSet):
+
+    async def async_get_children_page(self, paginator, child_hits, base_query):
+        """Returns a tuple of a page of child hits and their hit counts."""
+        page = await paginator.async_paginate_queryset(child_hits, self.request, self.async_client)
+        hit_counts = await self.async_get_batched_hit_counts([hit["_source"]["uri"] for hit in page], base_query)
+        return page, hit_counts
+
+    async def async_children(self, request, pk=None):
+        """Returns the direct children of a collection, like `children`.
+
+        The collection is fetched concurrently with the page of children and
+        their hit counts.
+        """
+        base_query = self.search.query()
+        child_hits = self.get_children_search(pk)
+        paginator = AsyncChildrenPaginator()
+        (page, hit_counts), obj = await asyncio.gather(
+            self.async_get_children_page(paginator, child_hits, base_query),
+            self.async_resolve_object(Collection, pk, source_fields=["group"], raw=True))
+        children = self.format_children(page, obj["_source"].get("group"), hit_counts)
+        serializer = ReferenceSerializer(children, many=True, context={"fields": self.get_requested_fields(ReferenceSerializer)})
+        return paginator.get_paginated_response(serializer.data)
+
+
+class AsyncObjectViewSet(AsyncDocumentMixin, ObjectViewSet):
+    pass
+
+
+class AsyncMyListView(AsyncViewMixin, MyListView):
+
+    async def async_post(self, request, format=None):
+        """Returns saved items grouped by collection, like `post`.
+
+        Collections and objects are fetched concurrently.
+        """
+        fields = self.get_requested_fields()
+        saved, identifiers = self.get_saved_identifiers(request.data.get("list", []))
+        results = await asyncio.gather(*(
+            self.async_resolve_objects(object_type, idents, source_fields=self.get_source_fields(fields), raw=True)
+            for object_type, idents in identifiers.items()))
+        resolved = {}
+        for (object_type, idents), objects in zip(identifiers.items(), results):
+            resolved.update(self.get_resolved_items(object_type, idents, objects))
+        return Response(self.group_items(saved, resolved, fields))
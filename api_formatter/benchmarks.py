@@ -0,0 +1,190 @@
+import json
+import math
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.urls import reverse
+from elasticsearch_dsl import Search
+from rac_es.documents import (Agent, BaseDescriptionComponent, Collection,
+                              Object, Term)
+from rest_framework.test import APIRequestFactory
+
+from argo import settings
+
+from .indexing import (bulk_index, document_action, read_documents,
+                       refresh_disabled)
+from .instrumentation import RequestStats, request_stats
+from .view_helpers import derived_fields, index_generation, index_status
+from .views import (AgentViewSet, CollectionViewSet, FacetView, MyListView,
+                    ObjectViewSet, SearchView, TermViewSet)
+
+BENCHMARK_QUERY = "rockefeller"
+
+DOCUMENT_TYPES = (
+    ("agent", Agent, AgentViewSet),
+    ("collection", Collection, CollectionViewSet),
+    ("object", Object, ObjectViewSet),
+    ("term", Term, TermViewSet),
+)
+
+
+class Route:
+    """A request to a view which is benchmarked."""
+
+    def __init__(self, name, view, url, method="get", data=None, **kwargs):
+        self.name = name
+        self.view = view
+        self.url = url
+        self.method = method
+        self.data = data
+        self.kwargs = kwargs
+
+    def request(self, factory):
+        if self.data is not None:
+            return getattr(factory, self.method)(self.url, self.data, format="json")
+        return getattr(factory, self.method)(self.url)
+
+    def __call__(self, factory):
+        response = self.view(self.request(factory), **self.kwargs)
+        if getattr(response, "streaming", False):
+            b"".join(response.streaming_content)
+        elif hasattr(response, "render"):
+            response.render()
+        if response.status_code >= 400:
+            raise RuntimeError("{} returned {}".format(self.url, response.status_code))
+        return response
+
+
+def allowed_host():
+    """Returns a host name allowed by the `ALLOWED_HOSTS` setting."""
+    return next((h.lstrip(".") for h in settings.ALLOWED_HOSTS if h != "*"), "localhost")
+
+
+def request_factory():
+    """Returns a request factory which uses an allowed host."""
+    return APIRequestFactory(SERVER_NAME=allowed_host())
+
+
+def load_corpus(client, directory):
+    """Indexes documents from a directory containing `agent`, `collection`, `object` and `term` subdirectories.
+
+    Documents are validated and indexed in the same way as by the
+    `load_documents` command, with refreshes disabled until all documents are
+    indexed. Returns the number of documents indexed.
+    """
+    index = settings.ELASTICSEARCH_DSL["default"]["index"]
+    BaseDescriptionComponent.init(using=client)
+    actions = (document_action(json.loads(text)) for source, text in read_documents([directory]))
+    count = 0
+    with refresh_disabled(client, index):
+        for ok, result in bulk_index(client, actions):
+            if not ok:
+                raise RuntimeError("Failed to index document: {}".format(result))
+            count += 1
+    return count
+
+
+def sample_identifiers(client, per_type):
+    """Returns a dict of identifiers of documents of each type, sorted so that samples are repeatable."""
+    index = settings.ELASTICSEARCH_DSL["default"]["index"]
+    samples = {}
+    for doc_type, doc_cls, viewset in DOCUMENT_TYPES:
+        search = Search(using=client, index=index).filter("term", type=doc_type).sort("_doc").source(False)
+        samples[doc_type] = [hit.meta.id for hit in search[:per_type].execute()]
+    return samples
+
+
+def get_routes(samples):
+    """Returns a route for every viewset action, with and without a query, for each sample document."""
+    routes = []
+    for doc_type, doc_cls, viewset in DOCUMENT_TYPES:
+        routes.append(Route("{}-list".format(doc_type), viewset.as_view({"get": "list"}, basename=doc_type),
+                            reverse("{}-list".format(doc_type))))
+        actions = ["retrieve"]
+        if doc_type in ["collection", "object"]:
+            actions.append("ancestors")
+        if doc_type == "collection":
+            actions += ["children", "tree", "minimap"]
+        for action in actions:
+            view = viewset.as_view({"get": action}, basename=doc_type)
+            for pk in samples[doc_type]:
+                url = reverse("{}-{}".format(doc_type, "detail" if action == "retrieve" else action), args=[pk])
+                routes.append(Route("{}-{}".format(doc_type, action), view, url, pk=pk))
+    routes.append(Route("search-list", SearchView.as_view({"get": "list"}, basename="search"), reverse("search-list")))
+    routes.append(Route("search-suggest", SearchView.as_view({"get": "suggest"}, basename="search"),
+                        "{}?title_suggest={}".format(reverse("search-suggest"), BENCHMARK_QUERY[:-1])))
+    routes.append(Route("facets", FacetView.as_view({"get": "retrieve"}, basename="search"), reverse("facets")))
+    saved = ["/objects/{}".format(pk) for pk in samples["object"]]
+    routes.append(Route("mylist", MyListView.as_view(), reverse("mylist"), method="post", data={"list": saved}))
+    with_query = []
+    for route in routes:
+        url = "{}{}query={}".format(route.url, "&" if "?" in route.url else "?", BENCHMARK_QUERY)
+        with_query.append(Route("{} ?query".format(route.name), route.view, url, route.method, route.data, **route.kwargs))
+    return routes + with_query
+
+
+def clear_caches():
+    """Clears response, object data, derived field and index caches."""
+    index = settings.ELASTICSEARCH_DSL["default"]["index"]
+    cache.clear()
+    derived_fields.clear()
+    index_generation.invalidate(index)
+    index_status.invalidate(index)
+
+
+def percentile(values, pct):
+    """Returns a percentile of a list of values, using the nearest-rank method."""
+    ordered = sorted(values)
+    return ordered[max(int(math.ceil(pct / 100 * len(ordered))) - 1, 0)]
+
+
+def run_benchmarks(routes, iterations=20, cold=True):
+    """Runs each route and returns a dict of results keyed by route name.
+
+    Results contain latency percentiles in milliseconds, the mean number of
+    Elasticsearch requests and the peak memory allocated by a single request.
+    Allocations are measured in a separate run, since tracing slows requests.
+    If `cold` is True, caches are cleared before every request.
+    """
+    factory = request_factory()
+    measurements = {}
+    for route in routes:
+        latencies, es_requests = measurements.setdefault(route.name, ([], []))
+        for i in range(iterations):
+            if cold:
+                clear_caches()
+            stats = RequestStats()
+            token = request_stats.set(stats)
+            start = time.perf_counter()
+            try:
+                route(factory)
+            finally:
+                request_stats.reset(token)
+            latencies.append((time.perf_counter() - start) * 1000)
+            es_requests.append(stats.count)
+    allocations = {}
+    tracemalloc.start()
+    try:
+        for route in routes:
+            if cold:
+                clear_caches()
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            route(factory)
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            allocations[route.name] = max(allocations.get(route.name, 0), peak)
+    finally:
+        tracemalloc.stop()
+    return {
+        name: {
+            "requests": len(latencies),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p90_ms": round(percentile(latencies, 90), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(max(latencies), 2),
+            "es_requests": round(sum(es_requests) / len(es_requests), 2),
+            "peak_alloc_kib": round(allocations[name] / 1024, 1),
+        }
+        for name, (latencies, es_requests) in measurements.items()
+    }
@@ -0,0 +1,123 @@
+import json
+from functools import wraps
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from .pagination import SearchAfterPaginationMixin
+
+CACHE_STATUS_HEADER = "X-Cache"
+
+
+def is_cursor_request(request):
+    """Returns True if a request is for a cursor page.
+
+    Cursor pages contain a point in time which expires long before cached data,
+    so they are neither cached nor validated with ETags.
+    """
+    return SearchAfterPaginationMixin.cursor_query_param in request.GET
+
+
+def response_cache_key(view, request):
+    """Returns a cache key for a request to a view.
+
+    Keys are based on the view, action, URL and sorted query parameters, as well
+    as the index generation, so cached responses expire when documents change.
+    """
+    params = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    identity = json.dumps([
+        type(view).__name__,
+        getattr(view, "action", None),
+        request.build_absolute_uri(request.path),
+        params])
+    return "response:{}:{}".format(view.get_index_generation(), sha1(identity.encode("utf-8")).hexdigest())
+
+
+def cache_response(func):
+    """Caches the data of successful responses returned by a view method.
+
+    Data is stored in Django's default cache, so it is rendered according to the
+    format requested by each client. Sets an `X-Cache` header indicating whether
+    the response was found in the cache. Cursor pages are not cached.
+    """
+
+    @wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        if is_cursor_request(request):
+            return func(self, request, *args, **kwargs)
+        key = response_cache_key(self, request)
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response[CACHE_STATUS_HEADER] = "HIT"
+            return response
+        response = func(self, request, *args, **kwargs)
+        if isinstance(response, Response) and response.status_code == 200:
+            cache.set(key, response.data)
+        response[CACHE_STATUS_HEADER] = "MISS"
+        return response
+    return wrapper
+
+
+class NotModified(Exception):
+    """Raised when the ETag for a conditional request matches the `If-None-Match` header."""
+
+    def __init__(self, etag):
+        super().__init__(etag)
+        self.etag = etag
+
+
+class ConditionalGetMixin:
+    """Adds strong ETags to GET responses and answers matching `If-None-Match` headers with 304.
+
+    ETags are calculated from the index generation and the request, so conditional
+    requests are answered before any search is executed. ETags are checked in
+    `initial`, so errors raised while calculating them are handled like errors
+    raised by the handler. Cursor pages do not have ETags.
+    """
+
+    etag = None
+
+    def get_etag(self, request):
+        params = sorted((key, value) for key, values in request.GET.lists() for value in values)
+        identity = json.dumps([
+            settings.RESPONSE_VERSION,
+            self.get_index_generation(),
+            request.build_absolute_uri(request.path),
+            params,
+            request.META.get("HTTP_ACCEPT", "")])
+        return '"{}"'.format(sha1(identity.encode("utf-8")).hexdigest())
+
+    def check_etag(self, request):
+        """Returns the ETag for a request, or None if it has none.
+
+        Raises `NotModified` if the ETag matches the `If-None-Match` header.
+        """
+        if request.method not in ("GET", "HEAD") or is_cursor_request(request):
+            return None
+        etag = self.get_etag(request)
+        etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if etag in etags or "*" in etags:
+            raise NotModified(etag)
+        return etag
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = self.check_etag(request)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            response = HttpResponseNotModified()
+            response["ETag"] = exc.etag
+            return response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag and response.status_code == 200:
+            response["ETag"] = self.etag
+        return response
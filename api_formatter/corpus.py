@@ -0,0 +1,269 @@
+import json
+import os
+import random
+from hashlib import sha1
+
+from .view_helpers import date_string, description_from_notes
+
+IDENTIFIER_ALPHABET = "23456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+IDENTIFIER_LENGTH = 22
+
+LEVELS = ("collection", "series", "subseries", "file")
+
+AGENT_REFERENCE_FIELDS = {"person": "people", "organization": "organizations", "family": "families"}
+
+NOTE_TYPES = ("scopecontent", "bioghist", "arrangement", "accessrestrict", "userestrict", "processinfo")
+
+
+def load_templates(directory):
+    """Returns a dict of fixture documents keyed by type, in a repeatable order.
+
+    Collections are split into top-level collections (`collection`) and
+    collections with ancestors (`component`).
+    """
+    templates = {"agent": [], "collection": [], "component": [], "object": [], "term": []}
+    for doc_type in ["agent", "collection", "object", "term"]:
+        type_dir = os.path.join(directory, doc_type)
+        for filename in sorted(os.listdir(type_dir)):
+            with open(os.path.join(type_dir, filename)) as f:
+                data = json.load(f)
+            if doc_type == "collection" and data.get("ancestors"):
+                templates["component"].append(data)
+            else:
+                templates[doc_type].append(data)
+    if not templates["component"]:
+        templates["component"] = templates["collection"]
+    for doc_type, docs in templates.items():
+        if not docs:
+            raise ValueError("No {} documents found in {}".format(doc_type, directory))
+    return templates
+
+
+def note_text(templates):
+    """Returns all note text in the templates, which is used as filler for generated notes."""
+    text = []
+    for docs in templates.values():
+        for doc in docs:
+            for note in doc.get("notes") or []:
+                for subnote in note["subnotes"]:
+                    text += [c for c in subnote.get("content") or [] if isinstance(c, str)]
+    return " ".join(" ".join(text).split()) or "Lorem ipsum dolor sit amet."
+
+
+class CorpusGenerator:
+    """Generates documents with the same shape as the fixtures, at a configurable scale.
+
+    Each of `collections` top-level collections is the root of a tree which is
+    `depth` collections deep, in which every collection above the lowest level
+    has `fan_out` child collections and every collection at the lowest level
+    has `objects` child objects. Every collection and object refers to
+    `references` agents and `references` terms, chosen from pools of
+    `agents` agents and `terms` terms, so lower pool sizes mean more reuse.
+    If `notes_size` is set, each collection and object has notes containing
+    about that many characters of text; otherwise notes are copied from the
+    fixture used as a template.
+
+    Documents are generated lazily and depth first, so memory use does not
+    grow with the size of the corpus. Identifiers are derived from `seed`, so
+    the same arguments always generate the same corpus.
+    """
+
+    def __init__(self, templates, collections=1, depth=3, fan_out=10, objects=10, agents=100, terms=100,
+                 references=3, notes_size=None, seed=0):
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.templates = templates
+        self.collections = collections
+        self.depth = depth
+        self.fan_out = fan_out
+        self.objects = objects
+        self.agents = agents
+        self.terms = terms
+        self.references = references
+        self.notes_size = notes_size
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.filler = note_text(templates) if notes_size else None
+        self.agent_references = [self.agent_reference(n) for n in range(agents)]
+        self.term_references = [self.term_reference(n) for n in range(terms)]
+        self.counters = {"agent": 0, "collection": 0, "object": 0, "term": 0}
+
+    def counts(self):
+        """Returns the number of documents of each type which will be generated."""
+        collections_per_tree = sum(self.fan_out ** level for level in range(self.depth))
+        return {
+            "agent": self.agents,
+            "collection": self.collections * collections_per_tree,
+            "object": self.collections * self.fan_out ** (self.depth - 1) * self.objects,
+            "term": self.terms,
+        }
+
+    def identifier(self, doc_type, n):
+        """Returns a repeatable identifier in the same format as fixture identifiers."""
+        value = int(sha1("{}:{}:{}".format(self.seed, doc_type, n).encode("utf-8")).hexdigest(), 16)
+        chars = []
+        for i in range(IDENTIFIER_LENGTH):
+            value, index = divmod(value, len(IDENTIFIER_ALPHABET))
+            chars.append(IDENTIFIER_ALPHABET[index])
+        return "".join(chars)
+
+    def template(self, template_type, n):
+        """Returns a shallow copy of a template.
+
+        Fields which differ between documents are replaced rather than
+        modified, so templates are never changed.
+        """
+        return dict(self.templates[template_type][n % len(self.templates[template_type])])
+
+    def title(self, template, n, template_type):
+        """Returns a template's title, with a suffix once the template has been used."""
+        cycle = n // len(self.templates[template_type])
+        return template["title"] if cycle == 0 else "{} {}".format(template["title"], cycle + 1)
+
+    def external_identifiers(self, doc_type, n):
+        return [{"identifier": "/synthetic/{}/{}".format(doc_type, n), "source": "archivesspace"}]
+
+    def agent_reference(self, n):
+        template = self.templates["agent"][n % len(self.templates["agent"])]
+        return {
+            "external_identifiers": self.external_identifiers("agent", n),
+            "identifier": self.identifier("agent", n),
+            "relator": None,
+            "role": "subject",
+            "title": self.title(template, n, "agent"),
+            "type": template["agent_type"],
+        }
+
+    def term_reference(self, n):
+        template = self.templates["term"][n % len(self.templates["term"])]
+        return {
+            "external_identifiers": self.external_identifiers("term", n),
+            "identifier": self.identifier("term", n),
+            "title": self.title(template, n, "term"),
+            "type": template["term_type"],
+        }
+
+    def choose(self, pool):
+        return self.random.sample(pool, min(self.references, len(pool)))
+
+    def notes(self, template):
+        if not self.notes_size:
+            return template.get("notes") or []
+        start = self.random.randrange(len(self.filler))
+        text = (self.filler * (self.notes_size // len(self.filler) + 2))[start:start + self.notes_size]
+        note_type = self.random.choice(NOTE_TYPES)
+        return [{
+            "source": "archivesspace",
+            "subnotes": [{"content": [text], "items": [], "type": "text"}],
+            "title": note_type.capitalize(),
+            "type": note_type,
+        }]
+
+    def agent(self, n):
+        data = self.template("agent", n)
+        reference = self.agent_reference(n)
+        creator = dict(reference, role="creator")
+        data.update({
+            "authorized_name": reference["title"],
+            "external_identifiers": reference["external_identifiers"],
+            "title": reference["title"],
+            "uri": "/agents/{}".format(reference["identifier"]),
+        })
+        for field in AGENT_REFERENCE_FIELDS.values():
+            data[field] = []
+        data[AGENT_REFERENCE_FIELDS[reference["type"]]] = [creator]
+        data["group"] = dict(data["group"], creators=[creator], identifier=data["uri"], title=reference["title"])
+        return reference["identifier"], data
+
+    def term(self, n):
+        data = self.template("term", n)
+        reference = self.term_reference(n)
+        data.update({
+            "external_identifiers": reference["external_identifiers"],
+            "title": reference["title"],
+            "uri": "/terms/{}".format(reference["identifier"]),
+        })
+        data["group"] = dict(data["group"], identifier=data["uri"], title=reference["title"])
+        return reference["identifier"], data
+
+    def component(self, doc_type, template_type, ancestors, group, position):
+        """Returns the identifier and data of a collection or object."""
+        n = self.counters[doc_type]
+        self.counters[doc_type] += 1
+        identifier = self.identifier(doc_type, n)
+        data = self.template(template_type, n)
+        data.pop("children", None)
+        data.update({
+            "ancestors": ancestors,
+            "external_identifiers": self.external_identifiers(doc_type, n),
+            "notes": self.notes(data),
+            "parent": ancestors[0]["identifier"] if ancestors else None,
+            "position": position,
+            "terms": self.choose(self.term_references),
+            "title": self.title(data, n, template_type),
+            "uri": "/{}s/{}".format(doc_type, identifier),
+        })
+        for field in AGENT_REFERENCE_FIELDS.values():
+            data[field] = []
+        for reference in self.choose(self.agent_references):
+            data[AGENT_REFERENCE_FIELDS[reference["type"]]].append(reference)
+        if doc_type == "collection":
+            data["level"] = LEVELS[min(len(ancestors), len(LEVELS) - 1)]
+            if group is None:
+                data["creators"] = [dict(self.random.choice(self.agent_references), role="creator")]
+                group = {
+                    "category": data["category"],
+                    "creators": data["creators"],
+                    "dates": data["dates"],
+                    "identifier": data["uri"],
+                    "title": data["title"],
+                }
+            else:
+                data["creators"] = group["creators"]
+        data["group"] = group
+        return identifier, data
+
+    def ancestor_reference(self, identifier, data):
+        return {
+            "dates": date_string(data["dates"]),
+            "description": description_from_notes(data["notes"]) or "",
+            "external_identifiers": data["external_identifiers"],
+            "identifier": identifier,
+            "level": data["level"],
+            "order": None,
+            "title": data["title"],
+            "type": "collection",
+        }
+
+    def collection_tree(self, ancestors, group, position, level):
+        template_type = "component" if ancestors else "collection"
+        identifier, data = self.component("collection", template_type, ancestors, group, position)
+        yield "collection", identifier, data
+        ancestors = [self.ancestor_reference(identifier, data)] + ancestors
+        if level + 1 < self.depth:
+            for child_position in range(self.fan_out):
+                yield from self.collection_tree(ancestors, data["group"], child_position, level + 1)
+        else:
+            for child_position in range(self.objects):
+                yield ("object",) + self.component("object", "object", ancestors, data["group"], child_position)
+
+    def documents(self):
+        """Yields a tuple of type, identifier and data for each document in the corpus."""
+        for n in range(self.agents):
+            yield ("agent",) + self.agent(n)
+        for n in range(self.terms):
+            yield ("term",) + self.term(n)
+        for position in range(self.collections):
+            yield from self.collection_tree([], None, position, 0)
+
+
+def write_corpus(documents, directory):
+    """Writes documents to a directory with the same layout as `fixtures`, returning the number written."""
+    count = 0
+    for doc_type, identifier, data in documents:
+        type_dir = os.path.join(directory, doc_type)
+        os.makedirs(type_dir, exist_ok=True)
+        with open(os.path.join(type_dir, "{}.json".format(identifier)), "w") as f:
+            json.dump(data, f)
+        count += 1
+    return count
@@ -0,0 +1,146 @@
+import json
+import os
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+import jsonschema
+from elasticsearch.helpers import parallel_bulk
+from rac_es.documents import Agent, Collection, Object, Term
+from rac_schemas import is_date, schemas_dir
+from rac_schemas.exceptions import ValidationError
+
+DOCUMENT_CLASSES = {"agent": Agent, "collection": Collection, "object": Object, "term": Term}
+
+
+@lru_cache(maxsize=None)
+def schema_validator(doc_type):
+    """Returns a validator for a document type, configured in the same way as `rac_schemas.is_valid`.
+
+    `is_valid` reads schemas and creates a validator for every document,
+    which takes far longer than validation itself, so validators are created
+    once per process.
+    """
+    with open(schemas_dir / "base.json") as f:
+        base_schema = json.load(f)
+    with open(schemas_dir / "{}.json".format(doc_type)) as f:
+        schema = json.load(f)
+    validator_cls = jsonschema.validators.extend(
+        jsonschema.Draft7Validator,
+        type_checker=jsonschema.Draft7Validator.TYPE_CHECKER.redefine("date", is_date),
+        validators=dict(jsonschema.Draft7Validator.VALIDATORS, date=is_date))
+    return validator_cls(schema, resolver=jsonschema.RefResolver.from_schema(base_schema))
+
+
+def validate_document(data):
+    """Validates a document against the schema for its type, raising `ValidationError` if it is not valid."""
+    try:
+        schema_validator(data["type"]).validate(data)
+    except jsonschema.exceptions.ValidationError as e:
+        raise ValidationError(e)
+
+
+def document_action(data, validate=True):
+    """Returns a bulk index action for a document, optionally validating it against its schema first."""
+    if not isinstance(data, dict):
+        raise ValueError("Document is not a JSON object")
+    doc_cls = DOCUMENT_CLASSES.get(data.get("type"))
+    if doc_cls is None:
+        raise ValueError("Unknown document type {}".format(data.get("type")))
+    if validate:
+        validate_document(data)
+    return doc_cls(**data).prepare_streaming_dict(data["uri"].split("/")[-1])
+
+
+def prepare_batch(batch, validate=True):
+    """Parses, validates and prepares a batch of documents for indexing.
+
+    `batch` is a list of tuples of source and JSON text, where the source
+    identifies the file or line the text was read from. Runs in worker
+    processes, so returns failures rather than raising them.
+
+    Returns a tuple of a list of actions and a list of tuples of source and
+    error message.
+    """
+    actions = []
+    failures = []
+    for source, text in batch:
+        try:
+            actions.append(document_action(json.loads(text), validate))
+        except (ValidationError, ValueError, KeyError, TypeError) as e:
+            failures.append((source, "{}: {}".format(type(e).__name__, str(e).splitlines()[0])))
+    return actions, failures
+
+
+def read_documents(paths):
+    """Yields a tuple of source and JSON text for each document in a list of paths.
+
+    Paths may be directories, which are searched recursively for `.json`
+    files containing one document each, or newline-delimited JSON files
+    containing one document per line.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith(".json"):
+                        file_path = os.path.join(dirpath, filename)
+                        with open(file_path) as f:
+                            yield file_path, f.read()
+        else:
+            with open(path) as f:
+                for line_number, line in enumerate(f, 1):
+                    if line.strip():
+                        yield "{}:{}".format(path, line_number), line
+
+
+def batched(iterable, size):
+    """Yields lists of up to `size` items from an iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bounded_map(executor, fn, iterable, window):
+    """Yields the results of calling `fn` on each item in an iterable using an executor, in order.
+
+    Unlike `Executor.map`, at most `window` items are submitted at once, so
+    large inputs are not read into memory before results are returned.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+@contextmanager
+def refresh_disabled(client, index):
+    """Disables refreshes of an index, restoring the previous refresh interval and refreshing on exit."""
+    settings = client.indices.get_settings(index=index, name="index.refresh_interval")
+    previous = settings.get(index, {}).get("settings", {}).get("index", {}).get("refresh_interval")
+    client.indices.put_settings(index=index, body={"index": {"refresh_interval": "-1"}})
+    try:
+        yield
+    finally:
+        client.indices.put_settings(index=index, body={"index": {"refresh_interval": previous}})
+        client.indices.refresh(index=index)
+
+
+def bulk_index(client, actions, thread_count=4, chunk_size=500):
+    """Indexes actions with `parallel_bulk`, yielding a tuple of success and result for each action.
+
+    Failed actions are yielded rather than raised, so that a load can
+    continue past individual failures.
+    """
+    yield from parallel_bulk(
+        client, actions, thread_count=thread_count, chunk_size=chunk_size,
+        raise_on_error=False, raise_on_exception=False)
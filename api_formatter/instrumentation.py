@@ -0,0 +1,197 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from elasticsearch import AIOHttpConnection, Urllib3HttpConnection
+
+logger = logging.getLogger(__name__)
+
+TOOK_PATTERN = re.compile(r'"took"\s*:\s*(\d+)')
+
+request_stats = ContextVar("request_stats", default=None)
+
+STREAM_END = object()
+
+
+def request_type(method, url):
+    """Returns the type of an Elasticsearch request, such as `search`, `count` or `get`."""
+    segments = url.split("?", 1)[0].strip("/").split("/")
+    if segments == [""]:
+        return "info"
+    if "scroll" in segments:
+        return "scroll"
+    endpoints = [s[1:] for s in segments if s.startswith("_")]
+    if not endpoints:
+        return method.lower()
+    return "get" if endpoints[-1] == "doc" else endpoints[-1]
+
+
+class RequestStats:
+    """Records the Elasticsearch requests made while handling a request."""
+
+    def __init__(self):
+        self.count = 0
+        self.types = Counter()
+        self.duration = 0.0
+        self.took = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.queries = []
+
+    def record(self, method, url, body, response, duration):
+        """Records a single Elasticsearch request.
+
+        `took` is read from the start of the response rather than from the
+        deserialized response, so responses are not parsed twice.
+        """
+        self.count += 1
+        kind = request_type(method, url)
+        self.types[kind] += 1
+        self.duration += duration
+        self.bytes_sent += len(body or b"")
+        self.bytes_received += len(response or "")
+        took = TOOK_PATTERN.search(response[:64]) if response else None
+        if took:
+            self.took += int(took.group(1))
+        self.queries.append((kind, url, body, duration))
+
+    def server_timing(self, total):
+        """Returns a `Server-Timing` header value."""
+        return 'es;dur={:.1f};desc="{} Elasticsearch requests", es-took;dur={}, total;dur={:.1f}'.format(
+            self.duration * 1000, self.count, self.took, total * 1000)
+
+    def as_dict(self, with_queries=False):
+        """Returns recorded stats, optionally including each request's type, URL, body and duration."""
+        data = {
+            "es_requests": self.count,
+            "es_request_types": dict(self.types),
+            "es_ms": round(self.duration * 1000, 1),
+            "es_took_ms": self.took,
+            "es_bytes_sent": self.bytes_sent,
+            "es_bytes_received": self.bytes_received,
+        }
+        if with_queries:
+            data["es_queries"] = [
+                {"type": kind, "url": url, "body": body.decode("utf-8", "replace") if isinstance(body, bytes) else body,
+                 "ms": round(duration * 1000, 1)}
+                for kind, url, body, duration in self.queries]
+        return data
+
+
+def finish_streaming(response, callback, stats=None):
+    """Calls `callback` once the content of a streaming response has been sent or closed.
+
+    If `stats` is given, Elasticsearch requests made while producing the
+    content, such as scroll requests, are recorded in it.
+    """
+    def content(iterator):
+        try:
+            while True:
+                token = request_stats.set(stats) if stats is not None else None
+                try:
+                    chunk = next(iterator, STREAM_END)
+                finally:
+                    if token is not None:
+                        request_stats.reset(token)
+                if chunk is STREAM_END:
+                    return
+                yield chunk
+        finally:
+            callback()
+    response.streaming_content = content(iter(response.streaming_content))
+
+
+class InstrumentedConnection(Urllib3HttpConnection):
+    """Connection which records requests in the stats of the current request, if any."""
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        stats = request_stats.get()
+        if stats is None:
+            return super().perform_request(method, url, params, body, timeout, ignore, headers)
+        start = time.perf_counter()
+        status, response_headers, data = super().perform_request(method, url, params, body, timeout, ignore, headers)
+        stats.record(method, url, body, data, time.perf_counter() - start)
+        return status, response_headers, data
+
+
+class InstrumentedAIOHttpConnection(AIOHttpConnection):
+    """Async connection which records requests in the stats of the current request, if any."""
+
+    async def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        stats = request_stats.get()
+        if stats is None:
+            return await super().perform_request(method, url, params, body, timeout, ignore, headers)
+        start = time.perf_counter()
+        status, response_headers, data = await super().perform_request(method, url, params, body, timeout, ignore, headers)
+        stats.record(method, url, body, data, time.perf_counter() - start)
+        return status, response_headers, data
+
+
+class ElasticsearchInstrumentationMiddleware:
+    """Reports the Elasticsearch requests made while handling each request.
+
+    Adds a `Server-Timing` header and logs a JSON line containing request
+    counts, durations and sizes. Requests slower than
+    `ELASTICSEARCH_SLOW_REQUEST_MS` also log the body of each Elasticsearch
+    request. Requests made while streaming a response are included in the
+    log, which is written once the response has been sent, but not in the
+    `Server-Timing` header.
+
+    Stats are also available to outer middleware as `request.es_stats`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = request.es_stats = RequestStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        return self.report(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats = request.es_stats = RequestStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        return self.report(request, response, stats, start)
+
+    def report(self, request, response, stats, start):
+        """Adds a `Server-Timing` header to a response and logs the stats for a request which started at `start`."""
+        response["Server-Timing"] = stats.server_timing(time.perf_counter() - start)
+        if response.streaming:
+            finish_streaming(response, lambda: self.log(request, response, stats, time.perf_counter() - start), stats)
+        else:
+            self.log(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def log(self, request, response, stats, total):
+        """Logs the stats for a request which took `total` seconds."""
+        slow_ms = settings.ELASTICSEARCH_SLOW_REQUEST_MS
+        log_data = {
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "ms": round(total * 1000, 1),
+            **stats.as_dict(with_queries=slow_ms is not None and total * 1000 >= slow_ms),
+        }
+        logger.info(json.dumps(log_data))
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch_dsl import connections
+
+from argo import settings
+
+from ...benchmarks import (get_routes, load_corpus, run_benchmarks,
+                           sample_identifiers)
+from ...recording import RECORD, REPLAY, use_recording
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks every API route, reporting latency percentiles, Elasticsearch requests and allocations. "
+        "Responses can be recorded from Elasticsearch with --record and replayed without it with --replay."
+    )
+
+    def add_arguments(self, parser):
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument("--record", metavar="PATH", help="Record Elasticsearch responses to a file.")
+        mode.add_argument("--replay", metavar="PATH", help="Replay Elasticsearch responses from a file instead of connecting to Elasticsearch.")
+        parser.add_argument("--load", metavar="DIR", help="Index documents from a directory of agent, collection, object and term directories first.")
+        parser.add_argument("--samples", type=int, default=3, help="Number of documents of each type to request (default 3).")
+        parser.add_argument("--iterations", type=int, default=20, help="Number of times each route is requested (default 20).")
+        parser.add_argument("--warm", action="store_true", help="Keep caches between requests, rather than clearing them before each request.")
+        parser.add_argument("--json", metavar="PATH", help="Write results to a JSON file.")
+
+    def handle(self, *args, **options):
+        alias = settings.ELASTICSEARCH_DSL["default"]["connection"]
+        if options["load"]:
+            if options["replay"]:
+                raise CommandError("--load cannot be used with --replay.")
+            count = load_corpus(connections.get_connection(alias), options["load"])
+            self.stdout.write("Indexed {} documents from {}".format(count, options["load"]))
+        if options["record"] or options["replay"]:
+            use_recording(options["record"] or options["replay"], RECORD if options["record"] else REPLAY)
+        samples = sample_identifiers(connections.get_connection(alias), options["samples"])
+        results = run_benchmarks(get_routes(samples), options["iterations"], cold=not options["warm"])
+        columns = ["requests", "p50_ms", "p90_ms", "p99_ms", "max_ms", "es_requests", "peak_alloc_kib"]
+        width = max(len(name) for name in results)
+        self.stdout.write("{}  {}".format("route".ljust(width), "  ".join(c.rjust(14) for c in columns)))
+        for name, result in results.items():
+            self.stdout.write("{}  {}".format(name.ljust(width), "  ".join(str(result[c]).rjust(14) for c in columns)))
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump({"options": {k: options[k] for k in ["samples", "iterations", "warm"]}, "results": results}, f, indent=2)
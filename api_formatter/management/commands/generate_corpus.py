@@ -0,0 +1,90 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch_dsl import connections
+from rac_es.documents import BaseDescriptionComponent
+from rac_schemas.exceptions import ValidationError
+
+from argo import settings
+
+from ...corpus import CorpusGenerator, load_templates, write_corpus
+from ...indexing import (DOCUMENT_CLASSES, bulk_index, refresh_disabled,
+                         validate_document)
+
+PROGRESS_INTERVAL = 100000  # number of documents between progress messages
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a corpus of agents, collections, objects and terms from the fixtures, "
+        "and indexes it in Elasticsearch or writes it to a directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--collections", type=int, default=1, help="Number of top-level collections (default 1).")
+        parser.add_argument("--depth", type=int, default=3, help="Number of levels of collections in each tree (default 3).")
+        parser.add_argument("--fan-out", type=int, default=10, help="Number of child collections of each collection above the lowest level (default 10).")
+        parser.add_argument("--objects", type=int, default=10, help="Number of objects in each collection at the lowest level (default 10).")
+        parser.add_argument("--agents", type=int, default=100, help="Number of agents, which are shared by all collections and objects (default 100).")
+        parser.add_argument("--terms", type=int, default=100, help="Number of terms, which are shared by all collections and objects (default 100).")
+        parser.add_argument("--references", type=int, default=3, help="Number of agents and of terms referenced by each collection and object (default 3).")
+        parser.add_argument("--notes-size", type=int, help="Characters of note text in each collection and object (default: copied from fixtures).")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for identifiers and references (default 0).")
+        parser.add_argument("--fixtures", default=os.path.join(settings.BASE_DIR, "fixtures"), help="Directory of fixtures used as templates.")
+        parser.add_argument("--output", metavar="DIR", help="Write documents to a directory laid out like the fixtures instead of indexing them.")
+        parser.add_argument("--threads", type=int, default=4, help="Number of threads sending bulk requests (default 4).")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of documents in each bulk request (default 500).")
+        parser.add_argument("--validate", action="store_true", help="Validate each document against its schema.")
+
+    def handle(self, *args, **options):
+        for option, minimum in [
+                ("collections", 1), ("depth", 1), ("fan_out", 0), ("objects", 0), ("agents", 1), ("terms", 1),
+                ("references", 0), ("notes_size", 0), ("threads", 1), ("chunk_size", 1)]:
+            if options[option] is not None and options[option] < minimum:
+                raise CommandError("--{} must be at least {}.".format(option.replace("_", "-"), minimum))
+        generator = CorpusGenerator(
+            load_templates(options["fixtures"]), collections=options["collections"], depth=options["depth"],
+            fan_out=options["fan_out"], objects=options["objects"], agents=options["agents"], terms=options["terms"],
+            references=options["references"], notes_size=options["notes_size"], seed=options["seed"])
+        counts = generator.counts()
+        self.stdout.write("Generating {} documents: {}".format(
+            sum(counts.values()), ", ".join("{} {}s".format(v, k) for k, v in counts.items())))
+        documents = self.progress(generator.documents(), options["validate"])
+        start = time.perf_counter()
+        if options["output"]:
+            count = write_corpus(documents, options["output"])
+        else:
+            count = self.index(documents, options["threads"], options["chunk_size"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write("{} {} documents in {:.1f}s ({:.0f} documents/s)".format(
+            "Wrote" if options["output"] else "Indexed", count, elapsed, count / elapsed if elapsed else 0))
+
+    def progress(self, documents, validate):
+        for count, (doc_type, identifier, data) in enumerate(documents, 1):
+            if validate:
+                try:
+                    validate_document(data)
+                except ValidationError as e:
+                    raise CommandError("Generated {} {} is not valid: {}".format(doc_type, identifier, e))
+            if count % PROGRESS_INTERVAL == 0:
+                self.stdout.write("{} documents generated".format(count))
+            yield doc_type, identifier, data
+
+    def index(self, documents, threads, chunk_size):
+        index = settings.ELASTICSEARCH_DSL["default"]["index"]
+        client = connections.get_connection(settings.ELASTICSEARCH_DSL["default"]["connection"])
+        BaseDescriptionComponent.init(using=client)
+        actions = (DOCUMENT_CLASSES[doc_type](**data).prepare_streaming_dict(identifier)
+                   for doc_type, identifier, data in documents)
+        count = 0
+        failures = []
+        with refresh_disabled(client, index):
+            for ok, result in bulk_index(client, actions, threads, chunk_size):
+                if ok:
+                    count += 1
+                else:
+                    failures.append(result)
+        if failures:
+            raise CommandError("Failed to index {} documents: {}".format(len(failures), failures[:10]))
+        return count
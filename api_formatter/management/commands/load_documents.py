@@ -0,0 +1,81 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch_dsl import connections
+from rac_es.documents import BaseDescriptionComponent
+
+from argo import settings
+
+from ...indexing import (batched, bounded_map, bulk_index, prepare_batch,
+                         read_documents, refresh_disabled)
+
+PROGRESS_INTERVAL = 100000  # number of documents between progress messages
+REPORTED_FAILURES = 10  # number of failures written to stderr
+
+
+class Command(BaseCommand):
+    help = (
+        "Validates and indexes documents from directories of JSON files or newline-delimited JSON files, "
+        "parsing and validating in parallel processes and indexing with parallel bulk requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Directories of JSON files, or newline-delimited JSON files.")
+        parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Number of processes parsing and validating documents (default: number of CPUs).")
+        parser.add_argument("--threads", type=int, default=4, help="Number of threads sending bulk requests (default 4).")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of documents in each bulk request (default 500).")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of documents parsed by a process at a time (default 1000).")
+        parser.add_argument("--no-validate", action="store_false", dest="validate", help="Do not validate documents against their schemas.")
+        parser.add_argument("--failures", metavar="PATH", help="Write every failure to a newline-delimited JSON file.")
+
+    def handle(self, *args, **options):
+        for option in ["processes", "threads", "chunk_size", "batch_size"]:
+            if options[option] < 1:
+                raise CommandError("--{} must be at least 1.".format(option.replace("_", "-")))
+        for path in options["paths"]:
+            if not os.path.exists(path):
+                raise CommandError("{} does not exist.".format(path))
+        index = settings.ELASTICSEARCH_DSL["default"]["index"]
+        client = connections.get_connection(settings.ELASTICSEARCH_DSL["default"]["connection"])
+        BaseDescriptionComponent.init(using=client)
+        self.failures = []
+        self.indexed = 0
+        self.start = time.perf_counter()
+        with ProcessPoolExecutor(options["processes"]) as executor, refresh_disabled(client, index):
+            batches = bounded_map(
+                executor, partial(prepare_batch, validate=options["validate"]),
+                batched(read_documents(options["paths"]), options["batch_size"]), options["processes"] * 2)
+            for ok, result in bulk_index(client, self.actions(batches), options["threads"], options["chunk_size"]):
+                if ok:
+                    self.indexed += 1
+                    if self.indexed % PROGRESS_INTERVAL == 0:
+                        self.stdout.write("{} documents indexed ({:.0f} documents/s)".format(self.indexed, self.rate()))
+                else:
+                    action, item = result.popitem()
+                    self.failures.append((item.get("_id"), item.get("error") or item.get("exception")))
+        self.report(options["failures"])
+
+    def actions(self, batches):
+        for actions, failures in batches:
+            self.failures += failures
+            yield from actions
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.indexed / elapsed if elapsed else 0
+
+    def report(self, failures_path):
+        self.stdout.write("Indexed {} documents in {:.1f}s ({:.0f} documents/s) with {} failures".format(
+            self.indexed, time.perf_counter() - self.start, self.rate(), len(self.failures)))
+        if failures_path:
+            with open(failures_path, "w") as f:
+                for source, error in self.failures:
+                    f.write(json.dumps({"source": source, "error": error}, default=str) + "\n")
+        for source, error in self.failures[:REPORTED_FAILURES]:
+            self.stderr.write("{}: {}".format(source, error))
+        if self.failures:
+            raise CommandError("{} documents could not be indexed.".format(len(self.failures)))
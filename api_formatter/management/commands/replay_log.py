@@ -0,0 +1,77 @@
+import gzip
+import json
+from collections import Counter
+from itertools import chain, islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmarks import allowed_host
+from ...recording import RECORD, REPLAY, use_recording
+from ...replay import HTTPTarget, WSGITarget, read_log, replay
+
+
+def open_log(path):
+    return gzip.open(path, "rt") if path.endswith(".gz") else open(path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays requests from Apache access logs in combined format, with their logged timing, against the "
+        "application in this process or over HTTP, and reports throughput, latency percentiles and error rates "
+        "for each route."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("logs", nargs="+", help="Access log files, optionally gzipped, in the order they were written.")
+        parser.add_argument("--url", help="Send requests to a running instance at this base URL instead of the application in this process.")
+        parser.add_argument("--concurrency", type=int, default=16, help="Maximum number of requests in flight (default 16).")
+        parser.add_argument("--speed", type=float, default=1.0, help="Multiple of the logged request rate, or 0 to send requests as fast as possible (default 1).")
+        parser.add_argument("--limit", type=int, help="Maximum number of requests to replay.")
+        stand_in = parser.add_mutually_exclusive_group()
+        stand_in.add_argument("--record-es", metavar="PATH", help="Record Elasticsearch responses to a file.")
+        stand_in.add_argument("--replay-es", metavar="PATH", help="Replay Elasticsearch responses from a file instead of connecting to Elasticsearch.")
+        parser.add_argument("--json", metavar="PATH", help="Write results to a JSON file.")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        if options["speed"] < 0:
+            raise CommandError("--speed cannot be negative.")
+        if options["url"]:
+            if options["record_es"] or options["replay_es"]:
+                raise CommandError("Elasticsearch responses can only be recorded or replayed by the application in this process.")
+            target = HTTPTarget(options["url"], options["concurrency"])
+        else:
+            if options["record_es"] or options["replay_es"]:
+                use_recording(options["record_es"] or options["replay_es"], RECORD if options["record_es"] else REPLAY)
+            from argo.wsgi import application
+            target = WSGITarget(application, allowed_host())
+        skipped = Counter()
+        logs = [open_log(path) for path in options["logs"]]
+        try:
+            entries = read_log(chain.from_iterable(logs), skipped)
+            if options["limit"]:
+                entries = islice(entries, options["limit"])
+            results = replay(entries, target, options["concurrency"], options["speed"])
+        finally:
+            for log in logs:
+                log.close()
+        summary = dict(results.summary(), skipped=dict(skipped))
+        self.report(summary)
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(summary, f, indent=2)
+
+    def report(self, summary):
+        self.stdout.write("Replayed {} requests in {}s ({} requests/s)".format(
+            summary["requests"], summary["duration_s"], summary["throughput_rps"]))
+        self.stdout.write("Statuses: {}".format(", ".join("{} {}".format(k, v) for k, v in summary["statuses"].items())))
+        self.stdout.write("Skipped: {}".format(", ".join("{} {}".format(v, k) for k, v in summary["skipped"].items()) or "none"))
+        self.stdout.write("Schedule lag: p99 {}ms, max {}ms".format(summary["p99_lag_ms"], summary["max_lag_ms"]))
+        if not summary["routes"]:
+            return
+        columns = ["requests", "p50_ms", "p90_ms", "p99_ms", "max_ms", "4xx_rate", "5xx_rate", "error_rate", "changed_status"]
+        width = max(len(route) for route in summary["routes"])
+        self.stdout.write("{}  {}".format("route".ljust(width), "  ".join(c.rjust(14) for c in columns)))
+        for route, result in summary["routes"].items():
+            self.stdout.write("{}  {}".format(route.ljust(width), "  ".join(str(result[c]).rjust(14) for c in columns)))
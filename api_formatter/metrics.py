@@ -0,0 +1,121 @@
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+from argo import settings
+
+from .caching import CACHE_STATUS_HEADER
+from .instrumentation import finish_streaming
+from .view_helpers import derived_fields
+
+# Metrics are aggregated across processes, such as mod_wsgi daemon processes,
+# when PROMETHEUS_MULTIPROC_DIR is set to a directory shared by all processes.
+MULTIPROCESS_DIR_VARIABLE = "PROMETHEUS_MULTIPROC_DIR"
+
+REQUEST_LATENCY = Histogram(
+    "argo_request_duration_seconds", "Request latency", ["route", "action"])
+RESPONSE_SIZE = Histogram(
+    "argo_response_size_bytes", "Response size", ["route", "action"],
+    buckets=(1000, 10000, 100000, 1000000, 10000000, float("inf")))
+ES_REQUESTS = Counter(
+    "argo_elasticsearch_requests", "Elasticsearch requests", ["type"])
+ES_REQUESTS_PER_REQUEST = Histogram(
+    "argo_elasticsearch_requests_per_request", "Elasticsearch requests made by each request", ["route", "action"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, float("inf")))
+RESPONSE_CACHE = Counter(
+    "argo_response_cache", "Response cache lookups", ["route", "action", "result"])
+DERIVED_FIELD_CACHE = Counter(
+    "argo_derived_field_cache_lookups", "Derived field cache lookups", ["result"])
+
+
+def route_labels(request):
+    """Returns the router basename and action of the view which handled a request.
+
+    Views which are not viewsets are labelled with their URL name.
+    """
+    return match_labels(getattr(request, "resolver_match", None), request.method)
+
+
+def match_labels(match, method):
+    """Returns the router basename and action of the view for a URL resolver match and request method."""
+    if match is None:
+        return "unmatched", ""
+    initkwargs = getattr(match.func, "initkwargs", {})
+    actions = getattr(match.func, "actions", None) or {}
+    return (initkwargs.get("basename") or match.url_name or "unnamed",
+            actions.get(method.lower(), method.lower()))
+
+
+class MetricsMiddleware:
+    """Records latency, response size, cache and Elasticsearch metrics for each request.
+
+    Should be placed before `ElasticsearchInstrumentationMiddleware`, which
+    provides the Elasticsearch request counts. Metrics for streaming
+    responses are recorded once the response has been sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        return self.finish(request, response, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.finish(request, response, start)
+
+    def finish(self, request, response, start):
+        """Records metrics for a request which started at `start`, once a streaming response has been sent."""
+        if response.streaming:
+            finish_streaming(response, lambda: self.record(request, response, time.perf_counter() - start))
+            return response
+        return self.record(request, response, time.perf_counter() - start)
+
+    def record(self, request, response, duration):
+        """Records metrics for a request which took `duration` seconds."""
+        labels = route_labels(request)
+        REQUEST_LATENCY.labels(*labels).observe(duration)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(*labels).observe(len(response.content))
+        if response.has_header(CACHE_STATUS_HEADER):
+            RESPONSE_CACHE.labels(*labels, response[CACHE_STATUS_HEADER].lower()).inc()
+        stats = getattr(request, "es_stats", None)
+        if stats is not None:
+            ES_REQUESTS_PER_REQUEST.labels(*labels).observe(stats.count)
+            for request_type, count in stats.types.items():
+                ES_REQUESTS.labels(request_type).inc(count)
+        hits, misses = derived_fields.take_lookups()
+        DERIVED_FIELD_CACHE.labels("hit").inc(hits)
+        DERIVED_FIELD_CACHE.labels("miss").inc(misses)
+        return response
+
+
+def get_registry():
+    """Returns a registry which collects metrics from all processes, or from this process if not in multiprocess mode."""
+    if os.environ.get(MULTIPROCESS_DIR_VARIABLE):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """Returns metrics in the Prometheus text format to clients in `METRICS_ALLOWED_IPS`."""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
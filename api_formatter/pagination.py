@@ -1,4 +1,135 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
 from django_elasticsearch_dsl_drf.pagination import LimitOffsetPagination
+from elasticsearch.exceptions import NotFoundError, RequestError
+from elasticsearch_dsl.connections import get_connection
+from elasticsearch_dsl.response import Response as SearchResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class SearchAfterPaginationMixin:
+    """Adds opt-in cursor pagination using `search_after` and a point in time.
+
+    Cursor pagination is used when the `cursor` parameter is present in the
+    request, with an empty value requesting the first page. Each page returns an
+    opaque cursor for the next page. The total number of results is only
+    calculated if the `count` parameter is `true`. Cursors whose point in time
+    has expired, or which Elasticsearch rejects, are treated as invalid.
+
+    If `raw_hits` is True, pages are lists of raw hit dicts rather than
+    `elasticsearch_dsl` hits.
+    """
+
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    keep_alive = "5m"
+    invalid_cursor_message = "Invalid cursor"
+    raw_hits = False
+
+    def use_cursor(self, request):
+        return self.cursor_query_param in request.GET
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, cursor):
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode("ascii")))
+            return position["pit"], position["search_after"]
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request) and not getattr(queryset, "_suggest", False):
+            return self.paginate_search_after(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def paginate_search_after(self, queryset, request):
+        """Returns a page of results following the position in the `cursor` parameter."""
+        pit_id, search_after = self.init_search_after(request)
+        from_cursor = pit_id is not None
+        if not from_cursor:
+            pit_id = get_connection(queryset._using).open_point_in_time(
+                index=queryset._index, keep_alive=self.keep_alive)["id"]
+        search = self.get_search_after_search(queryset, pit_id, search_after)
+        client = get_connection(search._using)
+        try:
+            resp = client.search(body=search.to_dict(), **search._params)
+        except (NotFoundError, RequestError):
+            if not from_cursor:
+                raise
+            raise NotFound(self.invalid_cursor_message)
+        page = self.get_search_after_page(search, resp)
+        if self.next_cursor is None:
+            client.close_point_in_time(body={"id": resp["pit_id"]}, ignore=404)
+        return page
+
+    def init_search_after(self, request):
+        """Reads pagination parameters from a request.
+
+        Returns a tuple of the point in time ID and `search_after` values from
+        the `cursor` parameter, or a tuple of None if a first page is requested.
+        """
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.count = None
+        self.next_cursor = None
+        cursor = request.GET.get(self.cursor_query_param)
+        if cursor:
+            return self.decode_cursor(cursor)
+        return None, None
+
+    def get_search_after_search(self, queryset, pit_id, search_after):
+        """Returns a search for a page of results in a point in time.
+
+        Point in time searches cannot target an index, so the index is removed
+        from the search once the point in time has been opened. Sorts are
+        extended with `_shard_doc` so that every hit has a unique sort value.
+        """
+        sort = queryset.to_dict().get("sort") or ["_score"]
+        search = queryset.index().sort(*sort, "_shard_doc").extra(
+            size=self.limit, pit={"id": pit_id, "keep_alive": self.keep_alive})
+        if search_after:
+            search = search.extra(search_after=search_after)
+        return search.extra(track_total_hits=self.request.GET.get(self.count_query_param) == "true")
+
+    def get_search_after_page(self, search, resp):
+        """Returns the hits in a search response, and sets the count and cursor for the next page.
+
+        The last page has no cursor for a next page, and callers close the
+        point in time once it has been fetched.
+        """
+        if self.request.GET.get(self.count_query_param) == "true":
+            self.count = resp["hits"]["total"]["value"]
+        hits = resp["hits"]["hits"]
+        if len(hits) == self.limit:
+            self.next_cursor = self.encode_cursor({"pit": resp["pit_id"], "search_after": hits[-1]["sort"]})
+        if self.raw_hits:
+            return hits
+        return list(SearchResponse(search, resp))
+
+    def get_next_cursor_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        if self.use_cursor(self.request):
+            return Response(OrderedDict([
+                ("count", self.count),
+                ("next", self.get_next_cursor_link()),
+                ("results", data),
+            ]))
+        return super().get_paginated_response(data)
+
+
+class SearchAfterLimitOffsetPagination(SearchAfterPaginationMixin, LimitOffsetPagination):
+    """Limit/offset pagination with opt-in cursor pagination."""
 
 
 class CollapseLimitOffsetPagination(LimitOffsetPagination):
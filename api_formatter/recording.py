@@ -0,0 +1,103 @@
+import json
+import threading
+from collections import defaultdict, deque
+from hashlib import sha1
+from urllib.parse import urlencode
+
+from elasticsearch import Urllib3HttpConnection
+from elasticsearch.exceptions import ConnectionError
+from elasticsearch_dsl import connections
+
+from argo import settings
+
+from .instrumentation import InstrumentedConnection
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class Recording:
+    """Elasticsearch responses recorded in a newline-delimited JSON file.
+
+    In `record` mode each response is appended to the file as it is received.
+    In `replay` mode responses are returned in the order they were recorded for
+    each request, with the last response repeated once all have been returned,
+    so a recording of a single run can be replayed any number of times.
+    """
+
+    def __init__(self, path, mode):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError("mode must be `{}` or `{}`".format(RECORD, REPLAY))
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.responses = defaultdict(deque)
+        if mode == REPLAY:
+            with open(path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.responses[entry["key"]].append((entry["status"], entry["headers"], entry["data"]))
+        else:
+            open(path, "w").close()
+
+    def key(self, method, url, params, body):
+        """Returns a key identifying a request."""
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        query = urlencode(sorted((params or {}).items()))
+        identity = json.dumps([method, url, query, body])
+        return sha1(identity.encode("utf-8")).hexdigest()
+
+    def add(self, key, status, headers, data):
+        """Appends a response to the recording."""
+        with self.lock, open(self.path, "a") as f:
+            f.write(json.dumps({"key": key, "status": status, "headers": dict(headers), "data": data}) + "\n")
+
+    def get(self, key):
+        """Returns the next recorded response for a request, or None if the request was not recorded."""
+        with self.lock:
+            responses = self.responses.get(key)
+            if not responses:
+                return None
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+
+class RecordReplayConnection(Urllib3HttpConnection):
+    """Connection which records responses from Elasticsearch, or replays recorded responses without Elasticsearch.
+
+    The `Recording` is passed as the `recording` connection argument.
+    """
+
+    def __init__(self, *args, recording=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recording = recording
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        key = self.recording.key(method, url, params, body)
+        if self.recording.mode == REPLAY:
+            response = self.recording.get(key)
+            if response is None:
+                raise ConnectionError("N/A", "No recorded response for {} {}".format(method, url), None)
+            status, response_headers, data = response
+            if not (200 <= status < 300) and status not in ignore:
+                self._raise_error(status, data)
+            return status, response_headers, data
+        status, response_headers, data = super().perform_request(method, url, params, body, timeout, ignore, headers)
+        self.recording.add(key, status, response_headers, data)
+        return status, response_headers, data
+
+
+class RecordedConnection(InstrumentedConnection, RecordReplayConnection):
+    """Records or replays responses, counting requests in the stats of the current request."""
+
+
+def use_recording(path, mode):
+    """Replaces the default Elasticsearch connection with one which records or replays responses.
+
+    Returns the `Recording`.
+    """
+    recording = Recording(path, mode)
+    connections.create_connection(
+        settings.ELASTICSEARCH_DSL["default"]["connection"], hosts=settings.ELASTICSEARCH_DSL["default"]["hosts"],
+        timeout=60, connection_class=RecordedConnection, recording=recording)
+    return recording
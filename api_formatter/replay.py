@@ -0,0 +1,241 @@
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from itertools import groupby
+from urllib.parse import unquote_to_bytes, urlsplit
+
+import urllib3
+from django.urls import Resolver404, resolve
+
+from .benchmarks import percentile
+from .metrics import match_labels
+
+# Apache combined log format: %h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-agent}i"
+LOG_PATTERN = re.compile(
+    r'(?P<remote_host>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<request>(?:[^"\\]|\\.)*)" (?P<status>\d{3}) \S+'
+    r'(?: "(?P<referer>(?:[^"\\]|\\.)*)" "(?P<user_agent>(?:[^"\\]|\\.)*)")?')
+LOG_TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+# Request bodies are not logged, so only requests without bodies can be replayed.
+REPLAYABLE_METHODS = ("GET", "HEAD", "OPTIONS")
+STATIC_PREFIX = "/static/"  # served by Apache rather than the application
+
+
+class LogEntry:
+    """A request parsed from an access log."""
+
+    def __init__(self, remote_host, time, method, path, status, referer=None, user_agent=None):
+        self.remote_host = remote_host
+        self.time = time
+        self.method = method
+        self.path = path
+        self.status = status
+        self.referer = referer
+        self.user_agent = user_agent
+
+
+def parse_line(line):
+    """Returns a `LogEntry` for a line in combined log format, or None if the line cannot be parsed."""
+    match = LOG_PATTERN.match(line)
+    if not match:
+        return None
+    request = match.group("request").split()
+    if len(request) != 3:
+        return None
+    try:
+        logged_time = datetime.strptime(match.group("time"), LOG_TIME_FORMAT)
+    except ValueError:
+        return None
+    return LogEntry(
+        match.group("remote_host"), logged_time, request[0], request[1], int(match.group("status")),
+        match.group("referer"), match.group("user_agent"))
+
+
+def read_log(lines, skipped):
+    """Yields replayable entries from lines of an access log, counting skipped lines by reason in `skipped`."""
+    for line in lines:
+        entry = parse_line(line)
+        if entry is None:
+            skipped["unparseable"] += 1
+        elif entry.method not in REPLAYABLE_METHODS:
+            skipped["request body not logged"] += 1
+        elif entry.path.startswith(STATIC_PREFIX):
+            skipped["static file"] += 1
+        else:
+            yield entry
+
+
+def schedule(entries):
+    """Yields a tuple of each entry and its offset in seconds from the first entry.
+
+    Logged times have a resolution of one second, so requests logged in the
+    same second are spread evenly across that second rather than sent at once.
+    """
+    first = None
+    for logged_time, group in groupby(entries, key=lambda entry: entry.time):
+        group = list(group)
+        if first is None:
+            first = logged_time
+        offset = (logged_time - first).total_seconds()
+        for i, entry in enumerate(group):
+            yield entry, offset + i / len(group)
+
+
+def route_name(method, path):
+    """Returns the name of the route which handles a request, such as `collection-children`."""
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return "unmatched"
+    return "-".join(label for label in match_labels(match, method) if label)
+
+
+class WSGITarget:
+    """Sends requests to a WSGI application in this process."""
+
+    def __init__(self, application, host):
+        self.application = application
+        self.host = host
+
+    def __call__(self, entry):
+        url = urlsplit(entry.path)
+        environ = {
+            "REQUEST_METHOD": entry.method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote_to_bytes(url.path).decode("iso-8859-1"),
+            "QUERY_STRING": url.query,
+            "SERVER_NAME": self.host,
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": self.host,
+            "REMOTE_ADDR": entry.remote_host,
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": BytesIO(),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        if entry.user_agent and entry.user_agent != "-":
+            environ["HTTP_USER_AGENT"] = entry.user_agent
+        status = []
+
+        def start_response(response_status, headers, exc_info=None):
+            status.append(response_status)
+            return lambda data: None
+
+        body = self.application(environ, start_response)
+        try:
+            for chunk in body:
+                pass
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+        return int(status[0].split()[0])
+
+
+class HTTPTarget:
+    """Sends requests over HTTP to a running instance of the application."""
+
+    def __init__(self, base_url, concurrency, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.pool = urllib3.PoolManager(maxsize=concurrency, retries=False, timeout=timeout)
+
+    def __call__(self, entry):
+        headers = {"User-Agent": entry.user_agent} if entry.user_agent and entry.user_agent != "-" else {}
+        response = self.pool.request(entry.method, self.base_url + entry.path, headers=headers, redirect=False)
+        return response.status
+
+
+class ReplayResults:
+    """Collects the status and latency of replayed requests."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.changed = Counter()
+        self.lags = []
+        self.duration = 0
+
+    def record(self, route, status, logged_status, latency, lag):
+        """Records a request. `status` is the name of the exception raised if the request failed."""
+        with self.lock:
+            self.latencies[route].append(latency)
+            self.statuses[route][status] += 1
+            if status != logged_status:
+                self.changed[route] += 1
+            self.lags.append(lag)
+
+    def route_summary(self, route):
+        latencies = self.latencies[route]
+        statuses = self.statuses[route]
+        count = len(latencies)
+        return {
+            "requests": count,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p90_ms": round(percentile(latencies, 90) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(max(latencies) * 1000, 2),
+            "4xx_rate": round(sum(n for s, n in statuses.items() if isinstance(s, int) and 400 <= s < 500) / count, 4),
+            "5xx_rate": round(sum(n for s, n in statuses.items() if isinstance(s, int) and s >= 500) / count, 4),
+            "error_rate": round(sum(n for s, n in statuses.items() if not isinstance(s, int)) / count, 4),
+            "changed_status": self.changed[route],
+        }
+
+    def summary(self):
+        """Returns throughput, error rates and schedule lag, with latencies and error rates for each route."""
+        requests = sum(len(latencies) for latencies in self.latencies.values())
+        statuses = Counter()
+        for route_statuses in self.statuses.values():
+            statuses.update(route_statuses)
+        return {
+            "requests": requests,
+            "duration_s": round(self.duration, 2),
+            "throughput_rps": round(requests / self.duration, 2) if self.duration else 0,
+            "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            "p99_lag_ms": round(percentile(self.lags, 99) * 1000, 2) if self.lags else 0,
+            "max_lag_ms": round(max(self.lags) * 1000, 2) if self.lags else 0,
+            "routes": {route: self.route_summary(route) for route in sorted(self.latencies)},
+        }
+
+
+def replay(entries, target, concurrency=16, speed=1.0):
+    """Sends logged requests to a target and returns `ReplayResults`.
+
+    Requests are sent at their logged offsets divided by `speed`, with at
+    most `concurrency` requests in flight, or as fast as `concurrency` allows
+    if `speed` is 0. Lag records how late each request was sent, so a replay
+    which could not keep up with the logged traffic can be recognized.
+    """
+    results = ReplayResults()
+    slots = threading.BoundedSemaphore(concurrency)
+    start = time.perf_counter()
+
+    def send(entry, due):
+        began = time.perf_counter()
+        try:
+            status = target(entry)
+        except Exception as e:
+            status = type(e).__name__
+        finally:
+            slots.release()
+        latency = time.perf_counter() - began
+        results.record(route_name(entry.method, entry.path), status, entry.status, latency, max(began - due, 0))
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        for entry, offset in schedule(entries):
+            due = start + (offset / speed if speed else 0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            slots.acquire()
+            executor.submit(send, entry, due if speed else time.perf_counter())
+    results.duration = time.perf_counter() - start
+    return results
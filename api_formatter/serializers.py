@@ -1,9 +1,216 @@
+from collections import OrderedDict
+from collections.abc import Mapping
 from datetime import datetime
+from functools import lru_cache
+from urllib.parse import quote
 
-from django.urls import reverse
+from django.urls import get_script_prefix, reverse
+from django.utils.http import RFC3986_SUBDELIMS
 from rest_framework import serializers
+from rest_framework.fields import SkipField, empty
+
+from .view_helpers import cached_description, document_version, get_value
+
+URI_PLACEHOLDER = "URIPLACEHOLDER"
+COMPILED_SERIALIZERS_CACHE_SIZE = 256  # compiled serializers cached for combinations of class and sparse fields
+
+
+@lru_cache(maxsize=None)
+def detail_uri_template(name, script_prefix):
+    """Returns a reversed detail URL containing a placeholder in place of the identifier."""
+    return reverse(name, kwargs={"pk": URI_PLACEHOLDER})
+
+
+def detail_uri(basename, pk):
+    """Returns the URI for a detail view without resolving the URL patterns on every call.
+
+    Identifiers which could not be matched by the detail URL pattern fall back
+    to `reverse`, so that errors are unchanged.
+    """
+    name = "{}-detail".format(basename)
+    pk = str(pk)
+    if not pk or "/" in pk or "." in pk:
+        return reverse(name, kwargs={"pk": pk})
+    return detail_uri_template(name, get_script_prefix()).replace(
+        URI_PLACEHOLDER, quote(pk, safe=RFC3986_SUBDELIMS + "/~:@"))
+
+
+# fields whose `to_representation` is equivalent to a builtin
+FIELD_CASTS = {serializers.CharField: str, serializers.IntegerField: int, serializers.FloatField: float}
+
+
+def compile_attribute(field):
+    """Returns a function which gets the value of a field's source from an instance.
+
+    Missing values are handled in the same way as the field's own
+    `get_attribute` method, which is also used for callable attributes. The
+    function is called with the serializer the field belongs to, whose own
+    field is used for defaults and callable attributes.
+    """
+    field_name = field.field_name
+    source_attrs = field.source_attrs
+    has_default = field.default is not empty
+    allow_null = field.allow_null
+    required = field.required
+
+    def get(serializer, instance):
+        value = instance
+        try:
+            for attr in source_attrs:
+                value = value[attr] if isinstance(value, Mapping) else getattr(value, attr)
+                if callable(value):
+                    return serializer.fields[field_name].get_attribute(instance)
+        except (KeyError, AttributeError):
+            if has_default:
+                return serializer.fields[field_name].get_default()
+            if allow_null:
+                return None
+            if not required:
+                raise SkipField()
+            return serializer.fields[field_name].get_attribute(instance)
+        return value
+    return get
+
+
+def compile_representation(field):
+    """Returns a function which converts a field's attribute to its serialized form.
+
+    The function is called with the serializer the field belongs to, so that
+    serializer methods and nested serializers are those of that serializer.
+    """
+    field_name = field.field_name
+    if isinstance(field, serializers.SerializerMethodField):
+        method_name = field.method_name
+        return lambda serializer, value: getattr(serializer, method_name)(value)
+    if isinstance(field, serializers.ListSerializer):
+        child = compile_serializer(field.child)
+        return lambda serializer, value: [child(serializer.fields[field_name].child, item) for item in value]
+    if isinstance(field, serializers.Serializer):
+        nested = compile_serializer(field)
+        return lambda serializer, value: nested(serializer.fields[field_name], value)
+    cast = FIELD_CASTS.get(type(field))
+    if cast is not None:
+        return lambda serializer, value: cast(value)
+    return lambda serializer, value: serializer.fields[field_name].to_representation(value)
+
+
+def compile_serializer(serializer):
+    """Returns a function which serializes an instance using a serializer's fields.
+
+    The output is the same as the serializer's `to_representation` method, but
+    fields are looked up and dispatched once rather than for every instance.
+    The function is called with a serializer and an instance, and can be used
+    with any serializer of the same class with the same fields.
+    """
+    compiled = [(field.field_name, compile_attribute(field), compile_representation(field))
+                for field in serializer._readable_fields]
+
+    def represent(serializer, instance):
+        ret = OrderedDict()
+        for field_name, get, to_representation in compiled:
+            try:
+                attribute = get(serializer, instance)
+            except SkipField:
+                continue
+            ret[field_name] = None if attribute is None else to_representation(serializer, attribute)
+        return ret
+    return represent
+
+
+@lru_cache(maxsize=COMPILED_SERIALIZERS_CACHE_SIZE)
+def compiled_serializer(serializer_class, fields):
+    """Returns the compiled function for a serializer class limited to a sorted tuple of sparse fields."""
+    return compile_serializer(serializer_class(context={"fields": list(fields)}))
+
+
+class CompiledSerializerMixin:
+    """Serializes instances with a function compiled from the serializer's fields.
+
+    Compiled functions are cached for each serializer class and set of sparse
+    fields in its context, so fields are compiled the first time a class is
+    used with those fields rather than by every serializer.
+    """
 
-from .view_helpers import description_from_notes
+    def to_representation(self, instance):
+        if not hasattr(self, "_compiled_representation"):
+            self._compiled_representation = compiled_serializer(
+                type(self), tuple(sorted(set(self.context.get("fields") or []))))
+        return self._compiled_representation(self, instance)
+
+
+def parse_sparse_fields(fields):
+    """Returns a nested dict of field names from a list of dotted paths."""
+    tree = {}
+    for path in fields:
+        branch = tree
+        for name in path.split("."):
+            branch = branch.setdefault(name, {})
+    return tree
+
+
+def limit_fields(serializer, tree):
+    """Removes fields which are not in a nested dict of field names from a serializer."""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    for name in list(serializer.fields):
+        if name not in tree:
+            serializer.fields.pop(name)
+        elif tree[name] and isinstance(serializer.fields[name], (serializers.Serializer, serializers.ListSerializer)):
+            limit_fields(serializer.fields[name], tree[name])
+
+
+def invalid_sparse_fields(serializer, tree, prefix=""):
+    """Returns the dotted paths in a nested dict of field names which are not fields of a serializer."""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    invalid = []
+    for name, branch in tree.items():
+        field = serializer.fields.get(name)
+        if field is None:
+            invalid.append(prefix + name)
+        elif branch and not isinstance(field, (serializers.Serializer, serializers.ListSerializer)):
+            invalid += ["{}{}.{}".format(prefix, name, child) for child in branch]
+        elif branch:
+            invalid += invalid_sparse_fields(field, branch, "{}{}.".format(prefix, name))
+    return invalid
+
+
+def sparse_source_includes(serializer, fields):
+    """Returns the `_source` fields needed to serialize a list of dotted field paths.
+
+    `uri` is always included, because views use it to add hit counts to
+    results.
+    """
+    sources = {"uri"}
+    for path in fields:
+        name, _, rest = path.partition(".")
+        field = serializer.fields.get(name)
+        if field is None:
+            continue
+        source = name if field.source == "*" else field.source
+        if name in serializer.sparse_source_fields:
+            sources.update(serializer.sparse_source_fields[name])
+        else:
+            nested = isinstance(field, (serializers.Serializer, serializers.ListSerializer))
+            sources.add("{}.{}".format(source, rest) if rest and nested else source)
+    return sorted(sources)
+
+
+class SparseFieldsMixin:
+    """Limits serialized fields to those in the `fields` context value.
+
+    `fields` is a list of field names, which may be dotted paths to fields of
+    nested serializers. `sparse_source_fields` maps fields which are not read
+    directly from a `_source` field of the same name to the `_source` fields
+    they are derived from.
+    """
+
+    sparse_source_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.context.get("fields"):
+            limit_fields(self, parse_sparse_fields(self.context["fields"]))
 
 
 class ExternalIdentifierSerializer(serializers.Serializer):
@@ -35,7 +242,7 @@ class SubnoteSerializer(serializers.Serializer):
 
     def get_content(self, obj):
         """Coerce content into a list so it can be serialized as JSON."""
-        return list(obj.content)
+        return list(get_value(obj, "content"))
 
 
 class NoteSerializer(serializers.Serializer):
@@ -71,7 +278,12 @@ class GroupSerializer(serializers.Serializer):
     title = serializers.CharField()
 
 
-class ReferenceSerializer(serializers.Serializer):
+class ReferenceSerializer(SparseFieldsMixin, CompiledSerializerMixin, serializers.Serializer):
+    sparse_source_fields = {
+        "description": ["notes"],
+        "uri": ["identifier", "type", "uri"],
+    }
+
     title = serializers.CharField()
     type = serializers.CharField(allow_null=True)
     #online = serializers.SerializerMethodField()
@@ -87,19 +299,21 @@ class ReferenceSerializer(serializers.Serializer):
     #    return getattr(obj, "online", True)
 
     def get_uri(self, obj):
-        if getattr(obj, "uri", None):
-            return obj.uri.rstrip('/')
-        basename = obj.type
+        if get_value(obj, "uri"):
+            return get_value(obj, "uri").rstrip('/')
+        basename = get_value(obj, "type")
         if basename in ["person", "organization", "family", "software"]:
             basename = "agent"
         elif basename in ["cultural_context", "function", "geographic",
                           "genre_form", "occupation", "style_period", "technique",
                           "temporal", "topical"]:
             basename = "term"
-        return reverse('{}-detail'.format(basename), kwargs={"pk": obj.identifier})
+        return detail_uri(basename, get_value(obj, "identifier"))
+
 
+class BaseListSerializer(SparseFieldsMixin, CompiledSerializerMixin, serializers.Serializer):
+    sparse_source_fields = {"uri": ["type"]}
 
-class BaseListSerializer(serializers.Serializer):
     uri = serializers.SerializerMethodField()
     type = serializers.CharField()
     title = serializers.CharField()
@@ -107,10 +321,16 @@ class BaseListSerializer(serializers.Serializer):
 
     def get_uri(self, obj):
         basename = self.context.get('view').basename or obj.type
-        return reverse('{}-detail'.format(basename), kwargs={"pk": obj.meta.id})
+        return detail_uri(basename, obj.meta.id)
 
 
-class BaseDetailSerializer(serializers.Serializer):
+class BaseDetailSerializer(SparseFieldsMixin, CompiledSerializerMixin, serializers.Serializer):
+    sparse_source_fields = {
+        "description": ["description", "notes"],
+        "offset": ["parent", "position"],
+        "uri": ["type"],
+    }
+
     uri = serializers.SerializerMethodField()
     title = serializers.CharField()
     type = serializers.CharField()
@@ -121,7 +341,7 @@ class BaseDetailSerializer(serializers.Serializer):
 
     def get_uri(self, obj):
         basename = self.context.get('view').basename or obj.type
-        return reverse('{}-detail'.format(basename), kwargs={"pk": obj.meta.id})
+        return detail_uri(basename, obj.meta.id)
 
 
 class AgentSerializer(BaseDetailSerializer):
@@ -152,7 +372,7 @@ class CollectionSerializer(BaseDetailSerializer):
     terms = ReferenceSerializer(many=True, allow_null=True)
 
     def get_description(self, obj):
-        return description_from_notes(getattr(obj, "notes", []))
+        return cached_description(document_version(obj), obj)
 
 
 class CollectionListSerializer(BaseListSerializer):
@@ -173,7 +393,7 @@ class ObjectSerializer(BaseDetailSerializer):
     terms = ReferenceSerializer(many=True, allow_null=True)
 
     def get_description(self, obj):
-        return description_from_notes(getattr(obj, "notes", []))
+        return cached_description(document_version(obj), obj)
 
 
 class ObjectListSerializer(BaseListSerializer):
@@ -190,8 +410,14 @@ class TermListSerializer(BaseListSerializer):
     pass
 
 
-class CollectionHitSerializer(serializers.Serializer):
+class CollectionHitSerializer(SparseFieldsMixin, CompiledSerializerMixin, serializers.Serializer):
     """Serializes data for collapsed hits."""
+    sparse_source_fields = {
+        "creators": ["group.creators.title"],
+        "dates": ["group.dates"],
+        "uri": ["group.identifier"],
+    }
+
     category = serializers.CharField(source="group.category")
     dates = serializers.SerializerMethodField()
     hit_count = serializers.IntegerField()
@@ -201,16 +427,17 @@ class CollectionHitSerializer(serializers.Serializer):
     creators = serializers.SerializerMethodField()
 
     def get_dates(self, obj):
-        return [d.to_dict() for d in obj.group.dates]
+        return [d if isinstance(d, dict) else d.to_dict() for d in get_value(get_value(obj, "group"), "dates")]
 
     def get_creators(self, obj):
-        if getattr(obj.group, "creators", None):
-            return [c.title for c in obj.group.creators]
+        creators = get_value(get_value(obj, "group"), "creators")
+        if creators:
+            return [get_value(c, "title") for c in creators]
         else:
             return []
 
     def get_uri(self, obj):
-        return obj.group.identifier.rstrip("/")
+        return get_value(get_value(obj, "group"), "identifier").rstrip("/")
 
 
 class FacetSerializer(serializers.Serializer):
@@ -236,7 +463,7 @@ class AncestorsSerializer(serializers.Serializer):
 
     def serialize_ancestors(self, ancestor_list, tree, idx):
         ancestor = ancestor_list[idx]
-        serialized = ReferenceSerializer(ancestor).data
+        serialized = ReferenceSerializer(ancestor, context=self.context).data
         tree_data = {**serialized, **tree}
         if idx == len(ancestor_list) - 1:
             new_tree = tree_data
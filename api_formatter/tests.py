@@ -1,22 +1,43 @@
+import base64
 import datetime
 import json
 import os
 import random
+from collections import Counter
+from contextlib import contextmanager
+from unittest import mock
 
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 from django.urls import reverse
+from elasticsearch.exceptions import NotFoundError
 from elasticsearch.helpers import streaming_bulk
 from elasticsearch_dsl import connections, utils
 from rac_es.documents import (Agent, BaseDescriptionComponent, Collection,
                               Object, Term)
 from rac_schemas import is_valid
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIRequestFactory
 
 from argo import settings
 
-from .view_helpers import date_string
-from .views import (AgentViewSet, CollectionViewSet, MyListView, ObjectViewSet,
-                    SearchView, TermViewSet)
+from .async_views import (AsyncCollectionViewSet, AsyncMyListView,
+                          AsyncObjectViewSet, get_async_client)
+from .caching import CACHE_STATUS_HEADER
+from .corpus import CorpusGenerator, load_templates
+from .indexing import prepare_batch
+from .instrumentation import (InstrumentedConnection, RequestStats,
+                              request_stats, request_type)
+from .replay import read_log, route_name, schedule
+from .serializers import CompiledSerializerMixin, ReferenceSerializer
+from .view_helpers import (DerivedFieldCache, IndexGeneration, IndexStatus,
+                           MinimapLayout, date_string, document_version,
+                           index_generation, index_status, minimap_bitsets)
+from .views import (AgentViewSet, CollectionViewSet, FacetView, MyListView,
+                    ObjectViewSet, SearchView, TermViewSet)
 
 TYPE_MAP = (
     ('agent', Agent, AgentViewSet),
@@ -25,16 +46,63 @@ TYPE_MAP = (
     ('term', Term, TermViewSet),
 )
 
+# Maximum number of Elasticsearch requests made by each route with empty caches,
+# without and with a `query` parameter.
+ES_REQUEST_BUDGETS = {
+    "list": (2, 2),
+    "retrieve": (3, 3),
+    "children": (4, 5),
+    "ancestors": (4, 5),
+    "tree": (3, 3),
+    "minimap": (5, 5),
+    "search": (2, 3),
+    "facets": (2, 2),
+    "suggest": (2, 2),
+    "mylist": (2, 2),
+}
+
+# A cursor for a point in time which no longer exists.
+EXPIRED_CURSOR = base64.urlsafe_b64encode(json.dumps({"pit": "expired", "search_after": [0]}).encode("utf-8")).decode("ascii")
+
 STOP_WORDS = ["a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if",
               "in", "into", "is", "it", "no", "not", "of", "on", "or", "such",
               "that", "the", "their", "then", "there", "these", "they", "this",
               "to", "was", "will", "with", "-", "--"]
 
 
-class TestAPI(TestCase):
+class ElasticsearchRequestsMixin:
+    """Provides assertions about the number of Elasticsearch requests made, similar to `assertNumQueries`."""
+
+    @contextmanager
+    def assertMaxElasticsearchRequests(self, budget, msg=None):
+        """Asserts that no more than `budget` Elasticsearch requests are made in the block.
+
+        Requests are only counted for connections using `InstrumentedConnection`.
+        """
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        try:
+            yield stats
+        finally:
+            request_stats.reset(token)
+        self.assertLessEqual(
+            stats.count, budget, "{}{} Elasticsearch requests made, budget is {}: {}".format(
+                "{}: ".format(msg) if msg else "", stats.count, budget,
+                ", ".join("{} {}".format(kind, url) for kind, url, body, duration in stats.queries)))
+
+    def clear_caches(self):
+        """Clears cached responses, object data and index checks, so that requests are counted with empty caches."""
+        index = settings.ELASTICSEARCH_DSL["default"]["index"]
+        cache.clear()
+        index_generation.invalidate(index)
+        index_status.invalidate(index)
+
+
+class TestAPI(ElasticsearchRequestsMixin, TestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
-        self.connection = connections.create_connection(hosts="http://elasticsearch:9200", timeout=60)
+        self.connection = connections.create_connection(
+            hosts="http://elasticsearch:9200", timeout=60, connection_class=InstrumentedConnection)
         BaseDescriptionComponent.init()
 
     def validate_fixtures(self):
@@ -65,6 +133,9 @@ class TestAPI(TestCase):
                 raise Exception("Failed to {} document {}: {}".format(action, result["_id"], result))
             else:
                 added_ids.append(result["_id"])
+        # cached data may have been created from an earlier index generation
+        index_generation.invalidate(settings.ELASTICSEARCH_DSL["default"]["index"])
+        cache.clear()
         return added_ids
 
     def get_nested_value(self, key_list, obj):
@@ -157,6 +228,14 @@ class TestAPI(TestCase):
         request = self.factory.get(base_url)
         response = base_viewset(request)
         self.assertFalse(all([r["uri"].endswith("/") for r in response.data.get('results')]))
+        self.assertEqual(response[CACHE_STATUS_HEADER], "MISS")
+        cached = base_viewset(self.factory.get(base_url))
+        self.assertEqual(cached[CACHE_STATUS_HEADER], "HIT")
+        self.assertEqual(cached.data, response.data)
+        for i in range(2):
+            cursor_response = base_viewset(self.factory.get("{}?cursor=".format(base_url)))
+            self.assertEqual(cursor_response.status_code, 200)
+            self.assertFalse(cursor_response.has_header(CACHE_STATUS_HEADER))
         self.assertEqual(
             obj_length, int(response.data['count']),
             "Number of documents in index for View {} did not match number indexed".format(
@@ -175,10 +254,20 @@ class TestAPI(TestCase):
                 response.status_code, 200,
                 "View {}-detail in ViewSet {} did not return 200 for document {}".format(
                     basename, viewset, pk))
-            for uri in list(filter(None, self.find_in_dict(response.data, "uri"))):
-                self.assertFalse(uri.endswith("/"))
+            for child_uri in list(filter(None, self.find_in_dict(response.data, "uri"))):
+                self.assertFalse(child_uri.endswith("/"))
             if basename in ["collection", "object"]:
                 self.assertTrue(isinstance(response.data["online"], bool))
+            sparse = self.factory.get("{}?fields=title,group.title".format(base_uri))
+            sparse_response = viewset.as_view(actions={"get": "retrieve"}, basename=basename)(sparse, pk=pk)
+            self.assertEqual(set(sparse_response.data), {"title", "group"})
+            self.assertEqual(set(sparse_response.data["group"]), {"title"})
+            invalid = self.factory.get("{}?fields=title,group.bogus".format(base_uri))
+            invalid_response = viewset.as_view(actions={"get": "retrieve"}, basename=basename)(invalid, pk=pk)
+            self.assertEqual(invalid_response.status_code, 400)
+            conditional = self.factory.get(uri, HTTP_IF_NONE_MATCH=response["ETag"])
+            conditional_response = viewset.as_view(actions={"get": "retrieve"}, basename=basename)(conditional, pk=pk)
+            self.assertEqual(conditional_response.status_code, 304)
 
     def ancestors_view(self, basename, viewset, pk):
         """Asserts the ancestor view returns the expected status code and data."""
@@ -192,6 +281,9 @@ class TestAPI(TestCase):
                 response.status_code, 200,
                 "View {}-ancestors in ViewSet {} did not return 200 for document {}".format(
                     basename, viewset, pk))
+        sparse = self.factory.get("{}?fields=title".format(base_uri))
+        response = viewset.as_view(actions={"get": "ancestors"}, basename=basename)(sparse, pk=pk)
+        self.assertEqual(set(response.data) - {"child"}, {"title"} if response.data else set())
 
     def children_view(self, viewset, pk):
         """Asserts the children view returns the expected status code and data."""
@@ -215,6 +307,29 @@ class TestAPI(TestCase):
             for online in self.find_in_dict(response.data, "online"):
                 self.assertTrue(isinstance(online, bool))
             self.assertEqual(EXPECTED_CHILDREN[pk], response.data["count"])
+        request = self.factory.get("{}?cursor=&count=true".format(base_uri))
+        response = viewset.as_view(actions={"get": "children"}, basename="collection")(request, pk=pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(EXPECTED_CHILDREN[pk], response.data["count"])
+        self.assertEqual(EXPECTED_CHILDREN[pk], len(response.data["results"]))
+        self.assertFalse(response.has_header("ETag"))
+        request = self.factory.get("{}?cursor={}".format(base_uri, EXPIRED_CURSOR))
+        response = viewset.as_view(actions={"get": "children"}, basename="collection")(request, pk=pk)
+        self.assertEqual(response.status_code, 404)
+
+    def tree_view(self, viewset, pk):
+        """Asserts the tree view returns the expected status code and structure."""
+        base_uri = reverse("collection-tree", args=[pk])
+        request = self.factory.get("{}?depth=2&fields=title,uri".format(base_uri))
+        response = viewset.as_view(actions={"get": "tree"}, basename="collection")(request, pk=pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], len(list(self.find_in_dict(response.data, "title"))))
+        for child in response.data["children"]:
+            self.assertEqual(set(child) - {"children"}, {"title", "uri"})
+        for invalid in ["depth=0", "depth=-1", "depth=x"]:
+            request = self.factory.get("{}?{}".format(base_uri, invalid))
+            response = viewset.as_view(actions={"get": "tree"}, basename="collection")(request, pk=pk)
+            self.assertEqual(response.status_code, 400)
 
     def minimap_view(self, pk):
         """Asserts the minimap view is correctly structured."""
@@ -223,6 +338,14 @@ class TestAPI(TestCase):
         for result in response.get("hits"):
             for key in ["index", "uri", "title", "online"]:
                 self.assertIsNot(result.get(key), None)
+        streamed = self.client.get("{}?query=rockefeller&stream=true".format(reverse("collection-minimap", args=[pk])))
+        self.assertEqual(json.loads(b"".join(streamed.streaming_content)), response)
+        compact = self.client.get("{}?query=rockefeller&compact=true".format(reverse("collection-minimap", args=[pk]))).json()
+        self.assertEqual(compact["count"], len(response["hits"]))
+        self.assertEqual(compact["total"], response["total"])
+        ranged = self.client.get("{}?query=rockefeller&start=0&end={}".format(
+            reverse("collection-minimap", args=[pk]), response["total"])).json()
+        self.assertEqual(sorted(hit["uri"] for hit in ranged["hits"]), sorted(hit["uri"] for hit in response["hits"]))
 
     def mylist_view(self, added_ids):
         """Asserts the MyList view returns the expected response status and results."""
@@ -232,6 +355,80 @@ class TestAPI(TestCase):
         self.assertEqual(
             response.status_code, 200, "MyList returned an error: {}".format(response.data))
         self.assertIsNot(response.data, [])
+        sparse = self.factory.post("{}?fields=title,uri".format(reverse("mylist")), {"list": list}, format="json")
+        for group in MyListView.as_view()(sparse).data:
+            for item in group["items"]:
+                self.assertEqual(set(item), {"title", "uri"})
+
+    def assert_request_budget(self, route, view, url, method="get", data=None, **kwargs):
+        """Asserts a view makes no more Elasticsearch requests than the budget for its route, with and without a query."""
+        for budget, query in zip(ES_REQUEST_BUDGETS[route], ["", "rockefeller"]):
+            self.clear_caches()
+            request_url = "{}{}query={}".format(url, "&" if "?" in url else "?", query) if query else url
+            request = getattr(self.factory, method)(request_url, data, format="json") if data else getattr(self.factory, method)(request_url)
+            with self.assertMaxElasticsearchRequests(budget, "{} {}".format(route, request_url)):
+                response = view(request, **kwargs)
+            self.assertEqual(response.status_code, 200)
+
+    def request_budgets(self, added_ids):
+        """Asserts each route stays within its Elasticsearch request budget."""
+        for doc_type, doc_cls, viewset in TYPE_MAP:
+            self.assert_request_budget(
+                "list", viewset.as_view(actions={"get": "list"}, basename=doc_type), reverse("{}-list".format(doc_type)))
+            for ident in added_ids[doc_type]:
+                self.assert_request_budget(
+                    "retrieve", viewset.as_view(actions={"get": "retrieve"}, basename=doc_type),
+                    reverse("{}-detail".format(doc_type), args=[ident]), pk=ident)
+                if doc_type in ["collection", "object"]:
+                    self.assert_request_budget(
+                        "ancestors", viewset.as_view(actions={"get": "ancestors"}, basename=doc_type),
+                        reverse("{}-ancestors".format(doc_type), args=[ident]), pk=ident)
+                if doc_type == "collection":
+                    for action in ["children", "tree", "minimap"]:
+                        self.assert_request_budget(
+                            action, viewset.as_view(actions={"get": action}, basename=doc_type),
+                            reverse("collection-{}".format(action), args=[ident]), pk=ident)
+        self.assert_request_budget(
+            "search", SearchView.as_view(actions={"get": "list"}, basename="search"), reverse("search-list"))
+        self.assert_request_budget(
+            "facets", FacetView.as_view(actions={"get": "retrieve"}, basename="search"), reverse("facets"))
+        self.assert_request_budget(
+            "suggest", SearchView.as_view(actions={"get": "suggest"}, basename="search"),
+            "{}?title_suggest=rockefelle".format(reverse("search-suggest")))
+        saved = ["/objects/{}".format(i) for i in added_ids["object"][:5]]
+        self.assert_request_budget("mylist", MyListView.as_view(), reverse("mylist"), method="post", data={"list": saved})
+
+    def async_views(self, added_ids):
+        """Asserts async views return the same data as the sync views they replace."""
+        requests = []
+        for doc_type, viewset, async_viewset in [
+                ("collection", CollectionViewSet, AsyncCollectionViewSet), ("object", ObjectViewSet, AsyncObjectViewSet)]:
+            for action in ["ancestors", "children"] if doc_type == "collection" else ["ancestors"]:
+                for ident in added_ids[doc_type]:
+                    url = reverse("{}-{}".format(doc_type, action), args=[ident])
+                    request_urls = [url, "{}?query=rockefeller".format(url)]
+                    if action == "children":
+                        request_urls.append("{}?cursor={}".format(url, EXPIRED_CURSOR))
+                    for request_url in request_urls:
+                        requests.append((
+                            viewset.as_view(actions={"get": action}, basename=doc_type),
+                            async_viewset.as_async_view({"get": action}, basename=doc_type, detail=True),
+                            lambda request_url=request_url: self.factory.get(request_url), {"pk": ident}))
+        saved = ["/objects/{}".format(i) for i in added_ids["object"][:5]]
+        requests.append((
+            MyListView.as_view(), AsyncMyListView.as_async_view({"post": "post"}),
+            lambda: self.factory.post(reverse("mylist"), {"list": saved}, format="json"), {}))
+
+        async def get_async_responses():
+            try:
+                return [await async_view(request(), **kwargs) for view, async_view, request, kwargs in requests]
+            finally:
+                await get_async_client().close()
+
+        for (view, async_view, request, kwargs), async_response in zip(requests, async_to_sync(get_async_responses)()):
+            response = view(request(), **kwargs)
+            self.assertEqual(async_response.status_code, response.status_code)
+            self.assertEqual(json.loads(async_response.content), json.loads(response.render().content))
 
     def test_suggest_view(self):
         """Assert that suggest view returns the expected status code and number of results."""
@@ -244,8 +441,9 @@ class TestAPI(TestCase):
     def test_documents(self):
         """Main test method for documents."""
         self.validate_fixtures()
+        all_added_ids = {}
         for doc_type, doc_cls, viewset in TYPE_MAP:
-            added_ids = self.index_fixture_data('fixtures/{}'.format(doc_type), doc_cls)
+            added_ids = all_added_ids[doc_type] = self.index_fixture_data('fixtures/{}'.format(doc_type), doc_cls)
             self.list_view(doc_cls, doc_type, viewset, len(added_ids))
             for ident in added_ids:
                 self.detail_view(doc_type, viewset, ident)
@@ -253,9 +451,12 @@ class TestAPI(TestCase):
                     self.ancestors_view(doc_type, viewset, ident)
                 if doc_type == "collection":
                     self.children_view(viewset, ident)
+                    self.tree_view(viewset, ident)
                     self.minimap_view(ident)
             if doc_type == "object":
                 self.mylist_view(["/objects/{}".format(i) for i in added_ids])
+        self.request_budgets(all_added_ids)
+        self.async_views(all_added_ids)
 
     def test_search(self):
         """Assert specific searches return expected number of results."""
@@ -270,6 +471,20 @@ class TestAPI(TestCase):
         schema = self.client.get(reverse('schema'))
         self.assertEqual(schema.status_code, 200, "Wrong HTTP code")
 
+    def test_metrics(self):
+        """Asserts scraped metrics are labelled with the route and action of each request."""
+        self.clear_caches()
+        self.client.get(reverse("collection-list"))
+        metrics = self.client.get(reverse("metrics")).content.decode()
+        for line in [
+                'argo_request_duration_seconds_count{action="list",route="collection"}',
+                'argo_elasticsearch_requests_per_request_count{action="list",route="collection"}',
+                'argo_response_cache_total{action="list",result="miss",route="collection"}',
+                '# TYPE argo_derived_field_cache_lookups_total counter',
+                'argo_derived_field_cache_lookups_total{result="hit"}']:
+            self.assertIn(line, metrics)
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1").status_code, 403)
+
     def test_facet_view(self):
         """Asserts the facet view is correctly structured."""
         response = self.client.get("{}?query=rockefeller".format(reverse("facets"))).json()
@@ -286,3 +501,202 @@ class TestAPI(TestCase):
                 ([{"begin": "1945"}, {"expression": "1950"}], "1945, 1950"),
                 ([{"begin": "1945", "end": "1946"}, {"expression": "1950"}], "1945-1946, 1950")]:
             self.assertEqual(date_string(input), expected)
+
+    def test_minimap_bitsets(self):
+        """Asserts minimap ordinals are calculated from groups of siblings, and bits are set by ordinal."""
+        layout = MinimapLayout(
+            [(None, 1, 7, 7, 1), ("a", 3, 0, 2, 3), ("b", 3, 0, 5, 3), ("root", 3, 1, 1, 3)],
+            lambda parent: {"b": [(0, "b0"), (2, "b2"), (5, "b5")], "root": [(1, "r0"), (1, "r1"), (1, "r2")]}[parent])
+        self.assertEqual(layout.total, 10)
+        matches = [(None, 7, "n", False), ("a", 1, "a1", True), ("a", 2, "a2", False), ("b", 2, "b2", False),
+                   ("b", 5, "b5", True), ("root", 1, "r0", False), ("root", 1, "r2", True), ("b", 3, "b3", True)]
+        ordinals = [layout.ordinal(parent, position, identifier) for parent, position, identifier, online in matches]
+        self.assertEqual(ordinals, [0, 2, 3, 5, 6, 7, 9, None])
+        query = layout.range_query(6, 8).to_dict()["bool"]
+        self.assertIn({"ids": {"values": ["b5"]}}, query["should"])
+        self.assertIn({"ids": {"values": ["r0"]}}, query["must"][0]["bool"]["should"])
+        compact = minimap_bitsets(layout.total, ((ordinal, match[-1]) for ordinal, match in zip(ordinals, matches)))
+        self.assertEqual(compact["count"], 7)
+        self.assertEqual(base64.b64decode(compact["hits"]), bytes([0b11101101, 0b00000010]))
+        self.assertEqual(base64.b64decode(compact["online"]), bytes([0b01000100, 0b00000010]))
+
+    def test_compiled_serializers(self):
+        """Asserts compiled serializers render every fixture to the same JSON as DRF serializers."""
+        renderer = JSONRenderer()
+        for doc_type, doc_cls, viewset in TYPE_MAP:
+            fixtures_dir = os.path.join(settings.BASE_DIR, "fixtures", doc_type)
+            view = viewset(basename=doc_type)
+            for f in sorted(os.listdir(fixtures_dir)):
+                with open(os.path.join(fixtures_dir, f)) as jf:
+                    data = json.load(jf)
+                hit = {"_index": "default", "_id": data["uri"].split("/")[-1], "_source": doc_cls(**data).to_dict()}
+                for serializer_class, instance in [
+                        (viewset.serializer, doc_cls.from_es(hit)),
+                        (viewset.list_serializer, doc_cls.from_es(hit)),
+                        (ReferenceSerializer, hit["_source"])]:
+                    compiled = renderer.render(serializer_class(instance, context={"view": view}).data)
+                    with mock.patch.object(CompiledSerializerMixin, "to_representation", serializers.Serializer.to_representation):
+                        expected = renderer.render(serializer_class(instance, context={"view": view}).data)
+                    self.assertEqual(compiled, expected, "{} {}/{}".format(serializer_class.__name__, doc_type, f))
+
+    def test_sparse_list_source(self):
+        """Asserts fields requested from list views are pushed down to `_source` filtering."""
+        for doc_type, doc_cls, viewset in TYPE_MAP:
+            url = reverse("{}-list".format(doc_type))
+            view = viewset(basename=doc_type, action="list", request=self.factory.get("{}?fields=title".format(url)))
+            self.assertEqual(
+                view.get_queryset().to_dict()["_source"], {"includes": ["title", "uri"], "excludes": ["ancestors", "children"]})
+            view = viewset(basename=doc_type, action="list", request=self.factory.get(url))
+            self.assertEqual(set(view.get_queryset().to_dict()["_source"]["includes"]), set(view.list_fields))
+
+    def test_prepare_tree(self):
+        """Asserts trees are assembled level by level and truncated breadth first."""
+        def hit(identifier, parent):
+            return {"_id": identifier, "_source": {
+                "title": identifier, "type": "collection", "uri": "/collections/{}".format(identifier), "parent": parent}}
+
+        descendants = [hit("other", "root"), hit("child", "root"), hit("grandchild", "child"), hit("great-grandchild", "grandchild")]
+        requested = []
+
+        def get_children(parents, size):
+            requested.append(size)
+            return [h for h in descendants if h["_source"]["parent"] in parents][:size]
+
+        for max_nodes, expected, sizes in [(1, (1, True), [2]), (2, (2, True), [3, 1]), (3, (3, False), [4, 2])]:
+            root = {"children": []}
+            requested.clear()
+            self.assertEqual(
+                CollectionViewSet().prepare_tree(root, "root", get_children, ["title"], 2, max_nodes), expected)
+            self.assertEqual(requested, sizes)
+        self.assertEqual(root["children"], [{"title": "other", "children": []}, {"title": "child", "children": [{"title": "grandchild"}]}])
+
+    def test_derived_field_cache(self):
+        """Asserts derived values are cached per document version and evicted when the cache is full."""
+        derived = DerivedFieldCache(maxsize=2)
+        self.assertEqual(derived.get(("default", "a", 1, 1), lambda: "first"), "first")
+        self.assertEqual(derived.get(("default", "a", 1, 1), lambda: "second"), "first")
+        self.assertEqual(derived.get(("default", "a", 2, 1), lambda: "second"), "second")
+        derived.get(("default", "b", 1, 1), lambda: "third")
+        self.assertNotIn(("default", "a", 1, 1), derived.values)
+        self.assertEqual(derived.stats(), {"hits": 1, "misses": 3, "size": 2, "hit_ratio": 0.25})
+        self.assertEqual(derived.take_lookups(), (1, 3))
+        derived.get(("default", "b", 1, 1), lambda: "fourth")
+        self.assertEqual(derived.take_lookups(), (1, 0))
+        self.assertIsNone(document_version({"_index": "default", "_id": "a", "_source": {}}))
+
+    def test_index_generation(self):
+        """Asserts the index generation changes when writes are made visible by a refresh."""
+        counters = {"index_total": 10, "delete_total": 0, "external_total": 3}
+
+        class StatsClient:
+            class indices:
+                def stats(index, metric):
+                    return {"indices": {"default": {"uuid": "u", "primaries": {
+                        "indexing": {"index_total": counters["index_total"], "delete_total": counters["delete_total"]},
+                        "refresh": {"total": counters["external_total"] * 2, "external_total": counters["external_total"]}}}}}
+
+        generation = IndexGeneration()
+        before = generation.fetch("default", StatsClient)
+        self.assertEqual(generation.fetch("default", StatsClient), before)
+        counters["external_total"] += 1
+        refreshed = generation.fetch("default", StatsClient)
+        self.assertNotEqual(refreshed, before)
+        counters["index_total"] += 1
+        self.assertNotEqual(generation.fetch("default", StatsClient), refreshed)
+
+    def test_index_status(self):
+        """Asserts index checks fetch and cache the index generation, and treat a missing index as not existing."""
+        class StatsClient:
+            class indices:
+                def stats(index, metric):
+                    if index == "missing":
+                        raise NotFoundError(404, "index_not_found_exception")
+                    return {"indices": {index: {"uuid": "u", "primaries": {"indexing": {"index_total": 1, "delete_total": 0}}}}}
+
+        status = IndexStatus()
+        with mock.patch("api_formatter.view_helpers.connections.get_connection", return_value=StatsClient):
+            self.assertFalse(status.exists("missing", "default"))
+            self.assertTrue(status.exists("present", "default"))
+            self.assertEqual(index_generation.get("present", None), IndexGeneration().fetch("present", StatsClient))
+        index_generation.invalidate("present")
+
+    def test_request_type(self):
+        """Asserts Elasticsearch requests are classified by endpoint."""
+        for method, url, expected in [
+                ("GET", "/", "info"),
+                ("POST", "/default/_search", "search"),
+                ("POST", "/default/_search?scroll=5m", "search"),
+                ("POST", "/_search/scroll", "scroll"),
+                ("POST", "/default/_count", "count"),
+                ("POST", "/_msearch", "msearch"),
+                ("GET", "/default/_doc/abc", "get"),
+                ("POST", "/default/_mget", "mget"),
+                ("HEAD", "/default", "head")]:
+            self.assertEqual(request_type(method, url), expected)
+
+    def test_generate_corpus_arguments(self):
+        """Asserts the corpus command rejects negative sizes, and zero where at least one is needed."""
+        for argument in ["--fan-out=-1", "--objects=-1", "--references=-1", "--notes-size=-1", "--depth=0", "--agents=0"]:
+            with self.assertRaises(CommandError):
+                call_command("generate_corpus", argument, "--output=unused")
+
+    def test_corpus_generator(self):
+        """Asserts generated corpora are valid and have the requested shape."""
+        generator = CorpusGenerator(
+            load_templates(os.path.join(settings.BASE_DIR, "fixtures")),
+            collections=2, depth=3, fan_out=2, objects=3, agents=5, terms=4, references=2, notes_size=300)
+        documents = {identifier: (doc_type, data) for doc_type, identifier, data in generator.documents()}
+        counts = {doc_type: len([d for d in documents.values() if d[0] == doc_type]) for doc_type in generator.counts()}
+        self.assertEqual(counts, generator.counts())
+        self.assertEqual(counts, {"agent": 5, "collection": 14, "object": 24, "term": 4})
+        for identifier, (doc_type, data) in documents.items():
+            self.assertTrue(is_valid(data, "{}.json".format(doc_type)), identifier)
+            self.assertEqual(data["uri"].split("/")[-1], identifier)
+            if doc_type in ["collection", "object"]:
+                self.assertEqual(data["parent"], data["ancestors"][0]["identifier"] if data["ancestors"] else None)
+                self.assertTrue(all(documents[a["identifier"]][0] == "collection" for a in data["ancestors"]))
+                self.assertEqual(data["group"]["identifier"], "/collections/{}".format(
+                    data["ancestors"][-1]["identifier"] if data["ancestors"] else identifier))
+                self.assertTrue(all(r["identifier"] in documents for r in data["terms"] + data["people"]))
+        self.assertEqual(
+            [identifier for _, identifier, _ in generator.documents()][:9],
+            list(documents)[:9], "corpus is not repeatable")
+
+    def test_prepare_batch(self):
+        """Asserts documents are prepared for indexing and failures are returned with their source."""
+        with open(os.path.join(settings.BASE_DIR, "fixtures", "object", "2tCPMsahXfUURDNEMLUFYs.json")) as f:
+            data = json.load(f)
+        invalid = dict(data)
+        del invalid["dates"]
+        actions, failures = prepare_batch([
+            ("valid", json.dumps(data)),
+            ("not json", "{"),
+            ("invalid", json.dumps(invalid)),
+            ("unknown type", json.dumps(dict(data, type="widget"))),
+            ("not an object", json.dumps([data]))])
+        self.assertEqual([a["_id"] for a in actions], ["2tCPMsahXfUURDNEMLUFYs"])
+        self.assertEqual(actions[0]["_op_type"], "index")
+        self.assertEqual([source for source, error in failures], ["not json", "invalid", "unknown type", "not an object"])
+        actions, failures = prepare_batch([("invalid", json.dumps(invalid))], validate=False)
+        self.assertEqual((len(actions), failures), (1, []))
+
+    def test_parse_access_log(self):
+        """Asserts access log lines are parsed and replayable requests are scheduled at their logged offsets."""
+        lines = [
+            '10.0.0.1 - - [01/Oct/2026:12:00:00 -0400] "GET /collections/abc/children?limit=5 HTTP/1.1" 200 512 "-" "Mozilla/5.0 \\"x\\""',
+            '10.0.0.2 - - [01/Oct/2026:12:00:00 -0400] "GET /search?query=rockefeller HTTP/1.1" 200 1024 "-" "-"',
+            '10.0.0.1 - - [01/Oct/2026:12:00:00 -0400] "POST /mylist HTTP/1.1" 200 64 "-" "-"',
+            '10.0.0.1 - - [01/Oct/2026:12:00:01 -0400] "GET /static/css/site.css HTTP/1.1" 200 64 "-" "-"',
+            '10.0.0.3 - - [01/Oct/2026:12:00:02 -0400] "GET /terms/xyz HTTP/1.1" 404 18',
+            'not a log line',
+        ]
+        skipped = Counter()
+        scheduled = list(schedule(read_log(lines, skipped)))
+        self.assertEqual(
+            [(entry.path, entry.status, offset) for entry, offset in scheduled],
+            [("/collections/abc/children?limit=5", 200, 0), ("/search?query=rockefeller", 200, 0.5), ("/terms/xyz", 404, 2)])
+        self.assertEqual(scheduled[0][0].user_agent, 'Mozilla/5.0 \\"x\\"')
+        self.assertEqual(skipped, {"request body not logged": 1, "static file": 1, "unparseable": 1})
+        self.assertEqual(
+            [route_name("GET", entry.path) for entry, offset in scheduled],
+            ["collection-children", "search-list", "term-retrieve"])
@@ -1,3 +1,11 @@
+import threading
+import time
+from base64 import b64encode
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from hashlib import sha1
+from itertools import chain, islice
+
 from django.http import Http404
 from django_elasticsearch_dsl_drf.constants import (LOOKUP_FILTER_PREFIX,
                                                     LOOKUP_FILTER_RANGE,
@@ -14,11 +22,16 @@ from django_elasticsearch_dsl_drf.filter_backends import (
     NestedFilteringFilterBackend, OrderingFilterBackend,
     SuggesterFilterBackend)
 from django_elasticsearch_dsl_drf.pagination import LimitOffsetPagination
-from elasticsearch_dsl import Index, Search, connections
+from elasticsearch.exceptions import NotFoundError, TransportError
+from elasticsearch.helpers import scan
+from elasticsearch_dsl import MultiSearch, Q, Search, connections
+from rest_framework.renderers import JSONRenderer
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
 from argo import settings
 
+from .pagination import SearchAfterPaginationMixin
+
 STRING_LOOKUPS = [
     LOOKUP_FILTER_TERMS,
     LOOKUP_FILTER_PREFIX,
@@ -37,6 +50,122 @@ NUMBER_LOOKUPS = [
 ]
 
 
+INDEX_CHECK_INTERVAL = 300  # seconds before a cached index check is refreshed
+
+
+class IndexStatus:
+    """Caches whether Elasticsearch indices exist for the life of a process.
+
+    Only positive checks are cached. Cached checks older than
+    `INDEX_CHECK_INTERVAL` are refreshed in a background thread, and can be
+    invalidated when a query fails because an index is missing. An index is
+    checked by fetching its generation token, which fails if the index is
+    missing, so the same request also caches the token.
+    """
+
+    def __init__(self):
+        self.checked = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def exists(self, index, using):
+        """Returns True if an index exists."""
+        with self.lock:
+            checked_at = self.checked.get(index)
+        if checked_at is None:
+            return self.refresh(index, using)
+        if time.monotonic() - checked_at > INDEX_CHECK_INTERVAL:
+            self.refresh_in_background(index, using)
+        return True
+
+    def refresh(self, index, using):
+        """Checks whether an index exists and caches the result."""
+        try:
+            try:
+                index_generation.refresh(index, connections.get_connection(using))
+                exists = True
+            except NotFoundError:
+                exists = False
+            with self.lock:
+                if exists:
+                    self.checked[index] = time.monotonic()
+                else:
+                    self.checked.pop(index, None)
+            return exists
+        finally:
+            with self.lock:
+                self.refreshing.discard(index)
+
+    def refresh_in_background(self, index, using):
+        """Refreshes a cached index check without blocking the current request."""
+        with self.lock:
+            if index in self.refreshing:
+                return
+            self.refreshing.add(index)
+        threading.Thread(target=self.refresh, args=(index, using), daemon=True).start()
+
+    def invalidate(self, index):
+        """Removes a cached index check, so the next request checks again."""
+        with self.lock:
+            self.checked.pop(index, None)
+
+
+index_status = IndexStatus()
+
+GENERATION_CHECK_INTERVAL = 30  # seconds before a cached index generation is refreshed
+
+
+class IndexGeneration:
+    """Caches a token which changes whenever the documents in an index change.
+
+    The token is a hash of the UUIDs of the indices a name resolves to, along
+    with the number of index and delete operations and of refreshes on their
+    primary shards, so it also changes when an alias is pointed at a different
+    index, and when writes become visible to searches after a refresh. Tokens
+    are cached per process for `GENERATION_CHECK_INTERVAL` seconds.
+    """
+
+    def __init__(self):
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def get(self, index, client):
+        """Returns the generation token for an index."""
+        with self.lock:
+            cached = self.tokens.get(index)
+        if cached and time.monotonic() - cached[1] <= GENERATION_CHECK_INTERVAL:
+            return cached[0]
+        return self.refresh(index, client)
+
+    def refresh(self, index, client):
+        """Fetches and caches the generation token for an index."""
+        token = self.fetch(index, client)
+        with self.lock:
+            self.tokens[index] = (token, time.monotonic())
+        return token
+
+    def fetch(self, index, client):
+        """Calculates the generation token for an index from index stats."""
+        stats = client.indices.stats(index=index, metric="indexing,refresh")
+        markers = []
+        for name, data in sorted(stats.get("indices", {}).items()):
+            indexing = data["primaries"]["indexing"]
+            refresh = data["primaries"].get("refresh", {})
+            # external refreshes are those which make changes visible to searches
+            refreshes = refresh.get("external_total", refresh.get("total"))
+            markers.append("{}:{}:{}:{}:{}".format(
+                name, data.get("uuid"), indexing["index_total"], indexing["delete_total"], refreshes))
+        return sha1(";".join(markers).encode("utf-8")).hexdigest()
+
+    def invalidate(self, index):
+        """Removes a cached generation token, so the next request fetches it again."""
+        with self.lock:
+            self.tokens.pop(index, None)
+
+
+index_generation = IndexGeneration()
+
+
 class SearchMixin:
     """Mixin that provides a search object for views."""
 
@@ -45,7 +174,7 @@ class SearchMixin:
         self.client = connections.get_connection(
             settings.ELASTICSEARCH_DSL['default']['connection']
         )
-        if not Index(self.index).exists():
+        if not index_status.exists(self.index, settings.ELASTICSEARCH_DSL['default']['connection']):
             raise Http404("Index `{}` does not exist".format(self.index))
         try:
             self.mapping = self.document._doc_type.mapping.properties.name
@@ -59,6 +188,65 @@ class SearchMixin:
         if issubclass(type(self), ReadOnlyModelViewSet):
             super(ReadOnlyModelViewSet, self).__init__(*args, **kwargs)
 
+    def get_index_generation(self):
+        """Returns a token which changes whenever the documents in the index change."""
+        return index_generation.get(self.index, self.client)
+
+    def handle_exception(self, exc):
+        """Returns a 404 response and invalidates the cached index check if the index is missing."""
+        if isinstance(exc, NotFoundError) and exc.error == "index_not_found_exception":
+            index_status.invalidate(self.index)
+            exc = Http404("Index `{}` does not exist".format(self.index))
+        return super().handle_exception(exc)
+
+
+class MultiSearchBatch:
+    """Collects searches and executes them in a single multi-search request.
+
+    Responses are returned in the order in which searches were added.
+    """
+
+    def __init__(self, client, index):
+        self.client = client
+        self.index = index
+        self.multi_search = MultiSearch(using=client, index=index)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, search):
+        """Adds a search to the batch."""
+        self.multi_search = self.multi_search.add(search)
+        self.size += 1
+        return self
+
+    def add_count(self, query):
+        """Adds a search which returns only the number of hits for a query."""
+        return self.add(Search(using=self.client, index=self.index).query(query).extra(size=0, track_total_hits=True))
+
+    def execute(self):
+        """Returns a list of responses, one for each search in the batch."""
+        if not self.size:
+            return []
+        return list(self.multi_search.execute())
+
+    def counts(self):
+        """Returns a list of hit counts, one for each search in the batch."""
+        return [response.hits.total.value for response in self.execute()]
+
+    async def async_counts(self, client):
+        """Returns a list of hit counts like `counts`, executing the batch with an `AsyncElasticsearch` client."""
+        if not self.size:
+            return []
+        responses = await client.msearch(index=self.index, body=self.multi_search.to_dict())
+        counts = []
+        for response in responses["responses"]:
+            if response.get("error"):
+                raise TransportError("N/A", response["error"]["type"], response["error"])
+            counts.append(response["hits"]["total"]["value"])
+        return counts
+
 
 class CustomFilteringFilterBackend(FilteringFilterBackend):
     """Provides search filter parameters to schema."""
@@ -144,17 +332,45 @@ ORDERING_FIELDS = {
 SEARCH_BACKENDS = FILTER_BACKENDS + [NestedFilteringFilterBackend, SuggesterFilterBackend]
 
 
-class ChildrenPaginator(LimitOffsetPagination):
+class ChildrenPaginator(SearchAfterPaginationMixin, LimitOffsetPagination):
+    raw_hits = True
 
     def paginate_queryset(self, queryset, request):
         """Custom method to paginate lists of children."""
-        self.request = request
-        self.limit = int(self.request.GET["limit"]) if self.request.GET.get("limit") else settings.REST_FRAMEWORK["PAGE_SIZE"]
-        self.offset = int(self.request.GET["offset"]) if self.request.GET.get("offset") else 0
+        if self.use_cursor(request):
+            return self.paginate_search_after(queryset, request)
+        self.init_limit_offset(request)
         self.count = queryset.count()
         if self.count == 0 or self.offset > self.count:
             return []
-        return list(queryset[self.offset:self.offset + self.limit])
+        return raw_search_hits(queryset[self.offset:self.offset + self.limit])
+
+    def init_limit_offset(self, request):
+        """Reads the `limit` and `offset` parameters from a request."""
+        self.request = request
+        self.limit = int(self.request.GET["limit"]) if self.request.GET.get("limit") else settings.REST_FRAMEWORK["PAGE_SIZE"]
+        self.offset = int(self.request.GET["offset"]) if self.request.GET.get("offset") else 0
+
+
+def execute_raw(search):
+    """Executes a search and returns the response without wrapping it in `elasticsearch_dsl` objects."""
+    return connections.get_connection(search._using).search(
+        index=search._index, body=search.to_dict(), **search._params)
+
+
+def raw_search_hits(search):
+    """Returns a list of the raw hits for a search."""
+    return execute_raw(search)["hits"]["hits"]
+
+
+def scan_raw(search):
+    """Yields raw hits for all documents matching a search, using the scroll API."""
+    return scan(connections.get_connection(search._using), query=search.to_dict(), index=search._index, **search._params)
+
+
+def get_value(obj, name, default=None):
+    """Returns a field from a `_source` dict or an `elasticsearch_dsl` object."""
+    return obj.get(name, default) if isinstance(obj, dict) else getattr(obj, name, default)
 
 
 def text_from_notes(notes, note_type):
@@ -186,4 +402,249 @@ def date_string(dates):
 
 
 def description_from_notes(notes):
-    return text_from_notes(notes, "abstract") if text_from_notes(notes, "abstract") else text_from_notes(notes, "scopecontent")
+    return text_from_notes(notes, "abstract") or text_from_notes(notes, "scopecontent")
+
+
+DERIVED_FIELD_CACHE_SIZE = 10000  # maximum number of cached derived values
+
+
+class DerivedFieldCache:
+    """Caches values derived from document fields, such as date strings and descriptions.
+
+    Values are keyed by document version, so a cached value is never used for
+    a changed document. The least recently used values are evicted once
+    `maxsize` values are cached. Hits and misses are counted so that the hit
+    ratio can be monitored.
+    """
+
+    def __init__(self, maxsize=DERIVED_FIELD_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.values = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.taken = (0, 0)
+
+    def get(self, key, compute):
+        """Returns the cached value for a key, calling `compute` to create it if it is not cached."""
+        with self.lock:
+            if key in self.values:
+                self.values.move_to_end(key)
+                self.hits += 1
+                return self.values[key]
+            self.misses += 1
+        value = compute()
+        with self.lock:
+            self.values[key] = value
+            while len(self.values) > self.maxsize:
+                self.values.popitem(last=False)
+        return value
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def stats(self):
+        """Returns the number of hits, misses and cached values, and the hit ratio."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.values), "hit_ratio": self.hit_ratio}
+
+    def take_lookups(self):
+        """Returns the number of hits and misses since the last call, so that they can be added to counters."""
+        with self.lock:
+            lookups = (self.hits - self.taken[0], self.misses - self.taken[1])
+            self.taken = (self.hits, self.misses)
+            return lookups
+
+    def clear(self):
+        """Removes all cached values and resets counters."""
+        with self.lock:
+            self.values.clear()
+            self.hits = self.misses = 0
+            self.taken = (0, 0)
+
+
+derived_fields = DerivedFieldCache()
+
+
+def document_version(hit):
+    """Returns the index, id, sequence number and primary term of a raw hit or `elasticsearch_dsl` document.
+
+    Returns None if the hit does not include a sequence number and primary term,
+    for example if it was returned by a search without `seq_no_primary_term`.
+    """
+    if isinstance(hit, dict):
+        version = tuple(hit.get(k) for k in ("_index", "_id", "_seq_no", "_primary_term"))
+    else:
+        meta = getattr(hit, "meta", None)
+        version = tuple(getattr(meta, k, None) for k in ("index", "id", "seq_no", "primary_term"))
+    return None if None in version else version
+
+
+def cached_date_string(version, source):
+    """Returns a date string for a document, using the cached value for its version if possible.
+
+    Values are only cached if `dates` were returned, so that a value derived
+    from a filtered `_source` is never cached.
+    """
+    dates = get_value(source, "dates")
+    if version is None or dates is None:
+        return date_string(dates or [])
+    return derived_fields.get(version + ("dates",), lambda: date_string(dates))
+
+
+def cached_description(version, source):
+    """Returns a description for a document, using the cached value for its version if possible.
+
+    Values are only cached if `notes` were returned, so that a value derived
+    from a filtered `_source` is never cached.
+    """
+    notes = get_value(source, "notes")
+    if version is None or notes is None:
+        return description_from_notes(notes or [])
+    return derived_fields.get(version + ("description",), lambda: description_from_notes(notes))
+
+
+def minimap_hit(result):
+    """Returns minimap data for a single `_source` dict."""
+    return {
+        "index": result["position"],
+        "uri": f"{result['uri'].rstrip('/')}",
+        "title": result["title"],
+        "online": result["online"]}
+
+
+def encode_bitset(bits):
+    """Returns a base64-encoded string from a bytearray bitset."""
+    return b64encode(bits).decode("ascii")
+
+
+MINIMAP_SORT = [{"parent": {"order": "asc", "missing": "_first"}}, "position", "_id"]
+MINIMAP_GROUPS_PAGE_SIZE = 10000  # number of sibling groups read by each minimap layout request
+
+
+class MinimapLayout:
+    """Numbers the descendants of a collection in minimap order.
+
+    Minimap order sorts descendants by parent, then by position and then by
+    `_id`, as in `MINIMAP_SORT`, so each group of siblings is a contiguous
+    run of ordinals. Ordinals in a group whose positions are unique and
+    consecutive are calculated from its first position, without reading any
+    descendants. The keys of the siblings in other groups are fetched with
+    `sibling_keys` when they are needed.
+    """
+
+    def __init__(self, groups, sibling_keys):
+        """Creates a layout from a list of `(parent, count, first, last, positioned)` tuples in minimap order.
+
+        `count` is the number of siblings in a group, `first` and `last` their
+        lowest and highest positions and `positioned` the number of siblings
+        which have a position. `sibling_keys` is called with a parent and
+        returns a sorted list of `minimap_sibling_key` tuples for its children.
+        """
+        self.groups = []
+        self.offsets = []
+        self.indexes = {}
+        self.total = 0
+        for parent, count, first, last, positioned in groups:
+            consecutive = positioned == count and first is not None and last - first + 1 == count
+            self.indexes[parent] = len(self.groups)
+            self.offsets.append(self.total)
+            self.groups.append((parent, count, first if consecutive else None))
+            self.total += count
+        self.sibling_keys = sibling_keys
+        self.keys = {}
+
+    def get_keys(self, parent):
+        """Returns the sorted keys of the siblings in a group."""
+        if parent not in self.keys:
+            self.keys[parent] = self.sibling_keys(parent)
+        return self.keys[parent]
+
+    def ordinal(self, parent, position, identifier):
+        """Returns the ordinal of a descendant, or None if it is not in the layout."""
+        index = self.indexes.get(parent)
+        if index is None:
+            return None
+        parent, count, first = self.groups[index]
+        if first is not None:
+            rank = None if position is None else position - first
+        else:
+            key = minimap_sibling_key(position, identifier)
+            keys = self.get_keys(parent)
+            rank = bisect_left(keys, key)
+            rank = rank if rank < len(keys) and keys[rank] == key else None
+        return self.offsets[index] + rank if rank is not None and 0 <= rank < count else None
+
+    def range_query(self, start, end):
+        """Returns a query for the descendants with ordinals from `start` up to, but not including, `end`."""
+        return self.bound_query(start, "gt", "gte") & self.bound_query(end - 1, "lt", "lte")
+
+    def bound_query(self, ordinal, parent_op, position_op):
+        """Returns a query for descendants after (`gt`) or before (`lt`) an ordinal, including the ordinal itself.
+
+        Descendants without a parent sort before all others.
+        """
+        index = bisect_right(self.offsets, ordinal) - 1
+        parent, count, first = self.groups[index]
+        rank = ordinal - self.offsets[index]
+        has_parent = Q("exists", field="parent")
+        if first is not None:
+            siblings = Q("term", parent=parent) if parent is not None else ~has_parent
+            siblings &= Q("range", position={position_op: first + rank})
+        else:
+            keys = self.get_keys(parent)
+            siblings = Q("ids", values=[identifier for position, identifier in (
+                keys[rank:] if parent_op == "gt" else keys[:rank + 1])])
+        if parent is None:
+            return siblings | has_parent if parent_op == "gt" else siblings
+        others = Q("range", parent={parent_op: parent})
+        return siblings | others if parent_op == "gt" else siblings | others | ~has_parent
+
+
+def minimap_sibling_key(position, identifier):
+    """Returns a key which sorts siblings in minimap order, with siblings without a position last."""
+    return (float("inf") if position is None else position, identifier)
+
+
+def minimap_bitsets(total, hits):
+    """Returns compact minimap data for `(ordinal, online)` tuples of matching descendants.
+
+    The descendant with ordinal `n` is bit `n % 8` (counting from the least
+    significant bit) of byte `n // 8`. Matching descendants are set in the hits
+    bitset, and those which are also online are set in the online bitset.
+    Descendants without an ordinal are skipped.
+    """
+    hit_bits = bytearray((total + 7) // 8)
+    online_bits = bytearray(len(hit_bits))
+    count = 0
+    for ordinal, online in hits:
+        if ordinal is None or not 0 <= ordinal < total:
+            continue
+        byte, bit = divmod(ordinal, 8)
+        hit_bits[byte] |= 1 << bit
+        if online:
+            online_bits[byte] |= 1 << bit
+        count += 1
+    return {"count": count, "hits": encode_bitset(hit_bits), "online": encode_bitset(online_bits), "total": total}
+
+
+def stream_minimap(total, results):
+    """Returns an iterator which yields a JSON-encoded minimap one hit at a time.
+
+    The output is identical to the JSON rendered for a minimap `Response`.
+    The first hit is read before returning, so that the first scroll request
+    is made, and any error is raised, before the response is started.
+    """
+    results = iter(results)
+    return encode_minimap(total, chain(list(islice(results, 1)), results))
+
+
+def encode_minimap(total, results):
+    """Yields a JSON-encoded minimap one hit at a time."""
+    renderer = JSONRenderer()
+    yield b'{"hits":['
+    for idx, result in enumerate(results):
+        yield (b"," if idx else b"") + renderer.render(minimap_hit(result))
+    yield b'],"total":' + renderer.render(total) + b"}"
@@ -1,10 +1,16 @@
-from django.http import Http404
+from bisect import bisect_left
+from copy import deepcopy
+
+from django.core.cache import cache
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
 from django_elasticsearch_dsl_drf.constants import SUGGESTER_TERM
-from django_elasticsearch_dsl_drf.pagination import LimitOffsetPagination
-from elasticsearch_dsl import A, Q
+from elasticsearch_dsl import A, Q, Search
+from elasticsearch_dsl.response import Hit
 from rac_es.documents import (Agent, BaseDescriptionComponent, Collection,
                               Object, Term)
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST
 from rest_framework.views import APIView
@@ -12,19 +18,40 @@ from rest_framework.viewsets import ReadOnlyModelViewSet
 
 from argo import settings
 
-from .pagination import CollapseLimitOffsetPagination
+from .caching import ConditionalGetMixin, cache_response
+from .pagination import (CollapseLimitOffsetPagination,
+                         SearchAfterLimitOffsetPagination)
 from .serializers import (AgentListSerializer, AgentSerializer,
                           AncestorsSerializer, CollectionHitSerializer,
                           CollectionListSerializer, CollectionSerializer,
                           FacetSerializer, ObjectListSerializer,
                           ObjectSerializer, ReferenceSerializer,
-                          TermListSerializer, TermSerializer)
+                          TermListSerializer, TermSerializer,
+                          invalid_sparse_fields, parse_sparse_fields,
+                          sparse_source_includes)
 from .view_helpers import (FILTER_BACKENDS, FILTER_FIELDS,
+                           MINIMAP_GROUPS_PAGE_SIZE, MINIMAP_SORT,
                            NESTED_FILTER_FIELDS, NUMBER_LOOKUPS,
                            ORDERING_FIELDS, SEARCH_BACKENDS, SEARCH_FIELDS,
                            SEARCH_NESTED_FIELDS, STRING_LOOKUPS,
-                           ChildrenPaginator, SearchMixin, date_string,
-                           description_from_notes)
+                           ChildrenPaginator, MinimapLayout, MultiSearchBatch,
+                           SearchMixin, cached_date_string, cached_description,
+                           document_version, execute_raw, minimap_bitsets,
+                           minimap_hit, minimap_sibling_key, raw_search_hits,
+                           scan_raw, stream_minimap)
+
+TREE_DEFAULT_DEPTH = 2
+TREE_MAX_NODES = 1000
+TREE_FIELDS = ["title", "type", "uri", "dates", "description", "group", "index"]
+
+OBJECT_DATA_FIELDS = ["ancestors", "dates", "notes", "title"]
+
+DOCUMENT_TYPES = {
+    Agent: "agent",
+    Collection: "collection",
+    Object: "object",
+    Term: "term",
+}
 
 
 class AncestorMixin(object):
@@ -36,50 +63,114 @@ class AncestorMixin(object):
 
     @action(detail=True)
     def ancestors(self, request, pk=None):
-        """Returns the ancestors of a collection or object."""
+        """Returns the ancestors of a collection or object.
+
+        Data for all ancestors is fetched in a single request.
+        """
         base_query = self.search.query()
-        obj = self.resolve_object(self.document, pk, source_fields=["ancestors"])
-        ancestors = list(getattr(obj, "ancestors", []))
+        obj = self.resolve_object(self.document, pk, source_fields=["ancestors"], raw=True)
+        ancestors = list(obj["_source"].get("ancestors", []))
+        ancestors_data = self.get_objects_data(Collection, [a["identifier"] for a in ancestors])
         if ancestors:
-            resource = self.resolve_object(Collection, obj.ancestors[-1].identifier, source_fields=["ancestors"])
-            if getattr(resource, "ancestors", None):
-                ancestors += list(resource.ancestors)
-        for a in ancestors:
-            data = self.get_object_data(Collection, a.identifier)
-            a.dates = data["dates"]
-            a.description = data["description"]
-            a.title = data["title"]
-            if len(self.request.GET):
-                a.hit_count, a.online_hit_count = self.get_hit_counts(a.identifier, base_query)
-        serializer = AncestorsSerializer(ancestors)
-        return Response(serializer.data)
+            if ancestors_data[-1] is None:
+                raise Http404("No object matches the given query.")
+            if ancestors_data[-1]["ancestors"]:
+                resource_ancestors = [dict(a) for a in ancestors_data[-1]["ancestors"]]
+                ancestors += resource_ancestors
+                ancestors_data += self.get_objects_data(Collection, [a["identifier"] for a in resource_ancestors])
+        hit_counts = None
+        if len(self.request.GET):
+            hit_counts = self.get_batched_hit_counts([a["identifier"] for a in ancestors], base_query)
+        return Response(self.serialize_ancestors(ancestors, ancestors_data, hit_counts))
+
+    def serialize_ancestors(self, ancestors, ancestors_data, hit_counts=None):
+        """Returns serialized ancestors, with data and hit counts for each ancestor added."""
+        for a, data in zip(ancestors, ancestors_data):
+            data = data or {}
+            a["dates"] = data.get("dates")
+            a["description"] = data.get("description")
+            a["title"] = data.get("title")
+        if hit_counts is not None:
+            for a, (hit_count, online_hit_count) in zip(ancestors, hit_counts):
+                a["hit_count"], a["online_hit_count"] = hit_count, online_hit_count
+        return AncestorsSerializer(ancestors, context={"fields": self.get_requested_fields(ReferenceSerializer)}).data
 
 
 class ObjectResolverMixin(object):
-    """Provides a `resolve_object` method, which returns an object based on object type and identifier."""
+    """Provides `resolve_object` and `resolve_objects` methods, which return objects based on object type and identifier.
 
-    def resolve_object(self, object_type, identifier, source_fields=None):
+    Objects are fetched with real-time get requests rather than searches. If
+    `raw` is True, objects are returned as raw get responses rather than
+    `elasticsearch_dsl` documents.
+    """
+
+    def get_source_params(self, object_type, source_fields=None, source_excludes=None):
+        """Returns `_source` filtering parameters for get requests.
+
+        The `type` field is always requested when filtering, so that the type of
+        the returned document can be checked.
+        """
+        params = {}
+        if source_fields:
+            params["_source_includes"] = list(dict.fromkeys(list(source_fields) + (["type"] if DOCUMENT_TYPES.get(object_type) else [])))
+        if source_excludes:
+            params["_source_excludes"] = list(source_excludes)
+        return params
+
+    def get_resolved_hit(self, object_type, doc, source_fields=None, raw=False):
+        """Returns a document from a raw get response.
+
+        Returns None if the document was not found or is not of the expected type.
+        """
+        if not doc.get("found"):
+            return None
+        source = doc.get("_source", {})
+        document_type = DOCUMENT_TYPES.get(object_type)
+        if document_type and source.get("type") != document_type:
+            return None
+        if source_fields and "type" not in source_fields:
+            source.pop("type", None)
+        if raw:
+            return doc
+        return object_type.from_es(doc) if object_type._matches(doc) else Hit(doc)
+
+    def resolve_object(self, object_type, identifier, source_fields=None, source_excludes=None, raw=False):
         """Returns an object based on object type and identifier.
 
-        Provides `source_fields` argument to allow for performant retrieval of
-        specific fields.
+        Provides `source_fields` and `source_excludes` arguments to allow for
+        performant retrieval of specific fields.
 
-        Returns an empty dictionary if object is not found.
+        Raises Http404 if object is not found.
         """
-        queryset = object_type.search(using=self.client).query().filter(
-            "match_phrase", **{"_id": identifier}
-        )
-        hits = queryset.source(source_fields).execute().hits if source_fields else queryset.execute().hits
-        count = len(hits)
-        if count != 1:
+        doc = self.client.get(
+            index=object_type._index._name,
+            id=identifier,
+            ignore=404,
+            **self.get_source_params(object_type, source_fields, source_excludes))
+        resolved = self.get_resolved_hit(object_type, doc, source_fields, raw)
+        if resolved is None:
             raise Http404("No object matches the given query.")
-        else:
-            return hits[0]
+        return resolved
 
+    def resolve_objects(self, object_type, identifiers, source_fields=None, source_excludes=None, raw=False):
+        """Returns a list of objects based on object type and identifiers.
 
-class DocumentViewSet(SearchMixin, ObjectResolverMixin, ReadOnlyModelViewSet):
+        Objects are fetched in a single multi-get request. The returned list is in
+        the same order as `identifiers`, with None in place of any object which
+        was not found.
+        """
+        if not identifiers:
+            return []
+        docs = self.client.mget(
+            index=object_type._index._name,
+            body={"ids": list(identifiers)},
+            **self.get_source_params(object_type, source_fields, source_excludes))["docs"]
+        return [self.get_resolved_hit(object_type, doc, source_fields, raw) for doc in docs]
+
+
+class DocumentViewSet(ConditionalGetMixin, SearchMixin, ObjectResolverMixin, ReadOnlyModelViewSet):
     filter_backends = FILTER_BACKENDS
-    pagination_class = LimitOffsetPagination
+    pagination_class = SearchAfterLimitOffsetPagination
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -89,83 +180,194 @@ class DocumentViewSet(SearchMixin, ObjectResolverMixin, ReadOnlyModelViewSet):
                 return self.serializer
         return self.serializer
 
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def get_requested_fields(self, serializer_class=None):
+        """Returns a list of fields requested in the `fields` parameter, which may be dotted paths.
+
+        Raises ParseError if any of the fields are not fields of the serializer.
+        """
+        fields = [f.strip() for f in self.request.GET.get("fields", "").split(",") if f.strip()]
+        if not fields:
+            return fields
+        invalid_fields = invalid_sparse_fields((serializer_class or self.get_serializer_class())(), parse_sparse_fields(fields))
+        if invalid_fields:
+            raise ParseError("Invalid fields: {}.".format(", ".join(sorted(invalid_fields))))
+        return fields
+
+    def get_source_fields(self, serializer_class=None):
+        """Returns the `_source` fields needed to serialize the requested fields, or None if no fields were requested."""
+        fields = self.get_requested_fields(serializer_class)
+        if not fields:
+            return None
+        return sparse_source_includes((serializer_class or self.get_serializer_class())(), fields)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fields"] = self.get_requested_fields()
+        return context
+
     def get_queryset(self):
-        """Returns only certain fields to improve performance of list views."""
+        """Returns only certain fields to improve performance of list views.
+
+        If the `fields` parameter exists, only the fields needed to serialize
+        the requested fields are returned.
+        """
         query = self.search.query()
-        if self.action == "list":
-            query = query.source(self.list_fields)
-        return query.source(excludes=["ancestors", "children"])
+        source_fields = self.get_source_fields()
+        if not source_fields and self.action == "list":
+            source_fields = self.list_fields
+        return query.source(includes=source_fields, excludes=["ancestors", "children"])
 
     def get_object(self):
         """Returns a specific object."""
         lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
-        queryset = self.get_queryset().filter(
-            "match_phrase", **{"_id": self.kwargs[lookup_url_kwarg]}
-        )
-        hits = queryset.execute().hits
-        count = len(hits)
-        if count != 1:
-            message = (
-                "No object matches the given query."
-                if count == 0
-                else "Multiple results matches the given query. Expected a single result."
-            )
-            raise Http404(message)
-        else:
-            hits[0].offset = self.get_offset(hits[0])
-            return hits[0]
-
-    def get_object_data(self, object_type, identifier):
-        """Gets additional data from an object.
-
-        Returns a dict containing a date string, text from Abstracts or Scope
-        and Contents notes and a boolean indicator of a digital surrogate.
+        obj = self.resolve_object(
+            self.document, self.kwargs[lookup_url_kwarg],
+            source_fields=self.get_source_fields(), source_excludes=["ancestors", "children"])
+        obj.offset = self.get_offset(obj)
+        return obj
+
+    def get_objects_data(self, object_type, identifiers):
+        """Gets additional data from a list of objects.
+
+        Returns a list of dicts in the same order as `identifiers`, each
+        containing a date string, text from Abstracts or Scope and Contents
+        notes, a title and the object's ancestors, or None if an object was not
+        found. Objects which are not cached are fetched in a single request, and
+        are cached until the index generation changes, so that data is shared
+        between requests for siblings.
         """
-        data = {"dates": None, "description": None, "title": None}
-        try:
-            resolved = self.resolve_object(object_type, identifier, source_fields=["dates", "notes", "title"])
-            data["description"] = description_from_notes(resolved.to_dict().get("notes", []))
-            data["dates"] = date_string(resolved.to_dict().get("dates", []))
-            data["title"] = resolved.title
-            return data
-        except Http404:
-            return data
+        keys, cached, missing = self.get_cached_objects_data(object_type, identifiers)
+        resolved = self.resolve_objects(object_type, missing, source_fields=OBJECT_DATA_FIELDS, raw=True)
+        return self.cache_objects_data(identifiers, keys, cached, dict(zip(missing, resolved)))
+
+    def get_cached_objects_data(self, object_type, identifiers):
+        """Returns a tuple of cache keys, cached data and the identifiers of objects which are not cached."""
+        generation = self.get_index_generation()
+        keys = ["object-data:{}:{}:{}".format(generation, object_type.__name__, i) for i in identifiers]
+        cached = cache.get_many(keys) if keys else {}
+        missing = [i for i, key in zip(identifiers, keys) if key not in cached]
+        return keys, cached, missing
+
+    def cache_objects_data(self, identifiers, keys, cached, resolved):
+        """Caches data from a dict of resolved objects and returns data for all objects in the order of `identifiers`."""
+        new_data = {}
+        for identifier, key in zip(identifiers, keys):
+            if identifier in resolved and resolved[identifier] is not None:
+                hit = resolved[identifier]
+                version, obj = document_version(hit), hit["_source"]
+                new_data[key] = {
+                    "dates": cached_date_string(version, obj),
+                    "description": cached_description(version, obj),
+                    "title": obj.get("title"),
+                    "ancestors": obj.get("ancestors", []),
+                }
+        if new_data:
+            cache.set_many(new_data)
+        return [cached.get(key, new_data.get(key)) for key in keys]
+
+    def get_sibling_positions(self, parent):
+        """Returns a sorted list of the positions of all children of a parent, or None.
+
+        Positions are fetched with a single scroll and cached until the index
+        generation changes. A scroll costs more than the count of siblings
+        which a single offset needs, so positions are only fetched once the
+        offset of a child of the parent has already been requested, and None
+        is returned before then.
+        """
+        key = "sibling-positions:{}:{}".format(self.get_index_generation(), parent)
+        positions = cache.get(key)
+        if positions is None and not cache.add("{}:requested".format(key), True):
+            search = self.search.query()
+            search.query = Q("match_phrase", parent=parent)
+            positions = sorted(hit["_source"]["position"] for hit in scan_raw(search.source(["position"]))
+                               if hit["_source"].get("position") is not None)
+            cache.set(key, positions)
+        return positions
 
     def get_offset(self, data):
         """Calculates the offset of an object or collection in a list of children."""
         offset = None
         if getattr(data, "position", None):
-            search = self.search
             if not getattr(data, 'parent', None):
                 offset = 0
             else:
-                search.query = Q("match_phrase", parent=data.parent)
-                offset = search.filter("range", position={'lt': data.position}).count()
+                positions = self.get_sibling_positions(data.parent)
+                if positions is None:
+                    search = self.search.query()
+                    search.query = Q("match_phrase", parent=data.parent)
+                    offset = search.filter("range", position={"lt": data.position}).count()
+                else:
+                    offset = bisect_left(positions, data.position)
         return offset
 
-    def get_hit_counts(self, uri, base_query):
-        """Gets the number of hits that are children of a specific component.
+    def get_hit_count_queries(self, uri, base_query):
+        """Returns queries for hits and online hits that are children of a specific component.
+
+        If the query filters on an object, removes that portion of the query so
+        that results for all object types are returned.
+        """
+        identifier = uri.lstrip("/").split("/")[-1]
+        q = Q("nested", path="ancestors", query=Q("match", ancestors__identifier=identifier)) | Q("ids", values=[identifier])
+        queryset = base_query.query(self.get_structured_query()).query(q)
+        query_dict = self.filter_queryset(queryset).to_dict()
+        # remove type from query, which limits results to the document type
+        if query_dict["query"]["bool"].get("filter"):
+            processed_filter = list(filter(lambda i: "term" not in i, query_dict["query"]["bool"]["filter"]))
+            query_dict["query"]["bool"]["filter"] = processed_filter
+        hit_query = deepcopy(query_dict["query"])
+        query_dict["query"]["bool"]["filter"] = [{"term": {"online": True}}]
+        return hit_query, query_dict["query"]
+
+    def get_aggregated_hit_counts(self, uris, base_query):
+        """Gets hit counts for a list of components in a single request.
+
+        Counts are calculated by `filters` aggregations, with one bucket per
+        component for all hits and one for online hits. Returns a list of
+        `(hit_count, online_hit_count)` tuples in the same order as `uris`.
+        """
+        if not (uris and self.request.GET.get(settings.REST_FRAMEWORK["SEARCH_PARAM"])):
+            return [(None, None) for uri in uris]
+        hit_filters = {}
+        online_filters = {}
+        for idx, uri in enumerate(uris):
+            hit_filters[str(idx)], online_filters[str(idx)] = self.get_hit_count_queries(uri, base_query)
+        search = Search(using=self.client, index=self.index).extra(size=0)
+        search.aggs.bucket("hit_count", "filters", filters=hit_filters)
+        search.aggs.bucket("online_hit_count", "filters", filters=online_filters)
+        aggregations = search.execute().aggregations
+        return [
+            (aggregations.hit_count.buckets[str(idx)].doc_count,
+             aggregations.online_hit_count.buckets[str(idx)].doc_count)
+            for idx in range(len(uris))]
+
+    def get_batched_hit_counts(self, uris, base_query):
+        """Gets hit counts for a list of components in a single multi-search request.
+
+        Returns a list of `(hit_count, online_hit_count)` tuples in the same
+        order as `uris`.
+        """
+        batch = self.get_hit_count_batch(uris, base_query)
+        if batch is None:
+            return [(None, None) for uri in uris]
+        counts = batch.counts()
+        return list(zip(counts[::2], counts[1::2]))
+
+    def get_hit_count_batch(self, uris, base_query):
+        """Returns a `MultiSearchBatch` of hit and online hit counts for a list of components.
 
-        If no query string exists in the request, returns None. If the query
-        filters on an object, removes that portion of the query so that results
-        for all object types are returned.
+        Returns None if no query string exists in the request.
         """
-        if self.request.GET.get(settings.REST_FRAMEWORK["SEARCH_PARAM"]):
-            identifier = uri.lstrip("/").split("/")[-1]
-            q = Q("nested", path="ancestors", query=Q("match", ancestors__identifier=identifier)) | Q("ids", values=[identifier])
-            queryset = base_query.query(self.get_structured_query()).query(q)
-            query_dict = self.filter_queryset(queryset).to_dict()
-            # remove type from query, which limits results to the document type
-            if query_dict["query"]["bool"].get("filter"):
-                processed_filter = list(filter(lambda i: "term" not in i, query_dict["query"]["bool"]["filter"]))
-                query_dict["query"]["bool"]["filter"] = processed_filter
-            self.search.query = query_dict["query"]
-            hit_count = self.search.query().count()
-            query_dict["query"]["bool"]["filter"] = [{"term": {"online": True}}]
-            self.search.query = query_dict["query"]
-            online_hit_count = self.search.query().count()
-            return hit_count, online_hit_count
-        return None, None
+        if not (uris and self.request.GET.get(settings.REST_FRAMEWORK["SEARCH_PARAM"])):
+            return None
+        batch = MultiSearchBatch(self.client, self.index)
+        for uri in uris:
+            hit_query, online_query = self.get_hit_count_queries(uri, base_query)
+            batch.add_count(hit_query).add_count(online_query)
+        return batch
 
     def get_structured_query(self):
         """Returns default query structure."""
@@ -242,66 +444,220 @@ class CollectionViewSet(DocumentViewSet, AncestorMixin):
     search_nested_fields = SEARCH_NESTED_FIELDS
     ordering_fields = ORDERING_FIELDS
 
-    def prepare_children(self, children, group, base_query):
-        """Appends additional data to each child object.
+    def prepare_children(self, hits, group, base_query):
+        """Returns the `_source` of each child hit with additional data appended.
 
         Adds `group` information from the parent collection, along with strings
         for dates and description.
 
-        If a query parameter exists, fetches the hit count.
+        If a query parameter exists, fetches hit counts for all children in a
+        single request.
         """
-        for c in children:
-            c.group = group  # append group from parent collection
-            c.dates = date_string(c.to_dict().get("dates", []))
-            c.description = description_from_notes(c.to_dict().get("notes", []))
-            if len(self.request.GET):
-                c.hit_count, c.online_hit_count = self.get_hit_counts(c.uri, base_query)
+        hit_counts = None
+        if len(self.request.GET):
+            hit_counts = self.get_batched_hit_counts([hit["_source"]["uri"] for hit in hits], base_query)
+        return self.format_children(hits, group, hit_counts)
+
+    def format_children(self, hits, group, hit_counts=None):
+        """Returns the `_source` of each child hit with group, dates, description and hit counts added."""
+        children = []
+        for hit in hits:
+            version, c = document_version(hit), hit["_source"]
+            c["group"] = group  # append group from parent collection
+            c["dates"] = cached_date_string(version, c)
+            c["description"] = cached_description(version, c)
+            children.append(c)
+        if hit_counts is not None:
+            for c, (hit_count, online_hit_count) in zip(children, hit_counts):
+                c["hit_count"], c["online_hit_count"] = hit_count, online_hit_count
         return children
 
-    def get_children_count(self, identifier):
-        """Returns a count of the number of children of a given collection."""
-        self.search.query = Q("nested", path="ancestors", query=Q("match", ancestors__identifier=identifier))
-        return self.search.query().source([]).count()
+    def get_children_search(self, pk):
+        """Returns a search for the direct children of a collection, sorted by position."""
+        self.search.query = Q("match_phrase", parent=pk)
+        source_fields = self.get_source_fields(ReferenceSerializer) or ["group", "type", "uri", "dates", "notes", "position", "title"]
+        return self.search.source(source_fields).sort("position").extra(seq_no_primary_term=True)
 
     @action(detail=True)
     def children(self, request, pk=None):
         """Returns the direct children of a collection."""
         base_query = self.search.query()
-        self.search.query = Q("match_phrase", parent=pk)
-        child_hits = self.search.source(
-            ["group", "type", "uri", "dates", "notes", "position", "title"]
-        ).sort("position")
-        obj = self.resolve_object(Collection, pk, source_fields=["group"])
+        child_hits = self.get_children_search(pk)
+        obj = self.resolve_object(Collection, pk, source_fields=["group"], raw=True)
         paginator = ChildrenPaginator()
         page = paginator.paginate_queryset(child_hits, request)
+        context = {"fields": self.get_requested_fields(ReferenceSerializer)}
         if page is not None:
-            page = self.prepare_children(page, obj.group, base_query)
-            serializer = ReferenceSerializer(page, many=True)
+            page = self.prepare_children(page, obj["_source"].get("group"), base_query)
+            serializer = ReferenceSerializer(page, many=True, context=context)
             return paginator.get_paginated_response(serializer.data)
-        children = self.prepare_children(child_hits, obj.group, base_query)
-        serializer = ReferenceSerializer(children, many=True)
+        children = self.prepare_children(raw_search_hits(child_hits), obj["_source"].get("group"), base_query)
+        serializer = ReferenceSerializer(children, many=True, context=context)
         return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True)
-    def minimap(self, request, pk=None):
-        """Returns search results minimap data."""
+    def tree(self, request, pk=None):
+        """Returns a nested tree of the descendants of a collection.
+
+        The `depth` parameter sets the number of levels returned, `limit` sets
+        the maximum number of nodes and `fields` is a comma-separated list of
+        fields, which may be dotted paths, to return for each node. Descendants
+        are fetched one level at a time, each with a single query sorted by
+        position.
+        """
+        try:
+            depth = int(request.GET.get("depth", TREE_DEFAULT_DEPTH))
+            max_nodes = max(1, min(int(request.GET.get("limit", TREE_MAX_NODES)), TREE_MAX_NODES))
+        except ValueError:
+            return Response({"detail": "`depth` and `limit` must be integers."}, status=HTTP_400_BAD_REQUEST)
+        if depth < 1:
+            return Response({"detail": "`depth` must be at least 1."}, status=HTTP_400_BAD_REQUEST)
+        fields = self.get_requested_fields(ReferenceSerializer) or TREE_FIELDS
+        invalid_fields = set(parse_sparse_fields(fields)) - set(TREE_FIELDS)
+        if invalid_fields:
+            return Response({"detail": "Invalid fields: {}.".format(", ".join(sorted(invalid_fields)))}, status=HTTP_400_BAD_REQUEST)
+        source_fields = {"parent", "type"}.union(sparse_source_includes(ReferenceSerializer(), fields))
+        children = self.search.source(sorted(source_fields)).sort("position", "_id").extra(seq_no_primary_term=True)
+        root = {"uri": reverse("collection-detail", kwargs={"pk": pk}), "children": []}
+        root["count"], root["truncated"] = self.prepare_tree(
+            root, pk, lambda parents, size: self.get_tree_level(children, parents, size), fields, depth, max_nodes)
+        if not root["children"]:
+            self.resolve_object(Collection, pk, source_fields=["uri"], raw=True)
+        return Response(root)
+
+    def get_tree_level(self, search, parents, size):
+        """Returns up to `size` raw hits for the children of a list of parents."""
+        search = search.extra(size=size)
+        search.query = Q("terms", parent=parents)
+        return raw_search_hits(search)
+
+    def prepare_tree(self, root, pk, get_children, fields, depth, max_nodes):
+        """Assembles descendants into a tree below a root node, one level at a time.
+
+        `get_children` is called with a list of parent identifiers and a number
+        of hits, and returns up to that many raw hits for their children,
+        sorted by position. No more than `max_nodes` descendants are kept, so
+        the tree is truncated breadth first. Returns the number of nodes
+        attached and whether any descendants were left out because of
+        `max_nodes`.
+        """
+        serializer = ReferenceSerializer(context={"fields": fields})
+        names = parse_sparse_fields(fields)
+        nodes = {pk: root}
+        parents = [pk]
+        count = 0
+        for level in range(depth):
+            if not parents:
+                break
+            hits = get_children(parents, max_nodes - count + 1)
+            truncated = len(hits) > max_nodes - count
+            parents = []
+            for hit in hits[:max_nodes - count]:
+                source = hit["_source"]
+                if "dates" in names:
+                    source["dates"] = cached_date_string(document_version(hit), source)
+                if "description" in names:
+                    source["description"] = cached_description(document_version(hit), source)
+                node = dict(serializer.to_representation(source))
+                if level < depth - 1:
+                    node["children"] = []
+                    parents.append(hit["_id"])
+                nodes[source["parent"]]["children"].append(node)
+                nodes[hit["_id"]] = node
+                count += 1
+            if truncated:
+                return count, True
+        return count, False
+
+    def get_minimap_search(self, ancestors_query):
+        """Returns a search for the descendants of a collection which are minimap hits."""
+        search = self.search.query()
+        search.query = (ancestors_query & self.get_structured_query()
+                        if self.request.GET.get(settings.REST_FRAMEWORK["SEARCH_PARAM"])
+                        else ancestors_query)
+        return self.filter_queryset(search)
+
+    def get_minimap_layout(self, ancestors_query):
+        """Returns the `MinimapLayout` of the descendants of a collection.
+
+        Groups of siblings are read with a composite aggregation, which needs
+        one request for every `MINIMAP_GROUPS_PAGE_SIZE` groups.
+        """
+        groups = []
+        after = {}
+        while True:
+            search = self.search.extra(size=0)
+            search.query = ancestors_query
+            search.aggs.bucket(
+                "siblings", "composite", size=MINIMAP_GROUPS_PAGE_SIZE, **after,
+                sources=[{"parent": {"terms": {"field": "parent", "missing_bucket": True}}}]
+            ).metric("first", "min", field="position").metric("last", "max", field="position").metric(
+                "positioned", "value_count", field="position")
+            siblings = execute_raw(search)["aggregations"]["siblings"]
+            for bucket in siblings["buckets"]:
+                first, last = bucket["first"]["value"], bucket["last"]["value"]
+                groups.append((
+                    bucket["key"]["parent"], bucket["doc_count"], None if first is None else int(first),
+                    None if last is None else int(last), bucket["positioned"]["value"]))
+            if len(siblings["buckets"]) < MINIMAP_GROUPS_PAGE_SIZE:
+                return MinimapLayout(groups, lambda parent: self.get_minimap_siblings(ancestors_query, parent))
+            after = {"after": siblings["after_key"]}
+
+    def get_minimap_siblings(self, ancestors_query, parent):
+        """Returns the sorted `minimap_sibling_key` tuples of the descendants of a collection with a parent."""
+        search = self.search.query()
+        search.query = ancestors_query & (Q("term", parent=parent) if parent is not None else ~Q("exists", field="parent"))
+        return sorted(minimap_sibling_key(hit["_source"].get("position"), hit["_id"])
+                      for hit in scan_raw(search.source(["position"])))
 
-        data = {"hits": []}
+    @action(detail=True)
+    def minimap(self, request, pk=None):
+        """Returns search results minimap data.
+
+        If the `compact` parameter is `true`, returns bitsets of matching and
+        online descendants instead of a list of hits, in which bit `n` is the
+        `n`th descendant in minimap order, sorted by parent and then by
+        position. Titles and URIs of the hits in a range of descendants in
+        the same order can then be fetched using the `start` and `end`
+        parameters, in which case the `index` of each hit is its place in
+        minimap order. Both are calculated from the size and positions of each
+        group of siblings, so only hits are read.
+
+        If the `stream` parameter is `true`, hits are written to the client as
+        they are scrolled from Elasticsearch rather than collected in memory.
+        """
+        try:
+            start = max(0, int(request.GET.get("start") or 0))
+            end = max(0, int(request.GET["end"])) if request.GET.get("end") else None
+        except ValueError:
+            return Response({"detail": "`start` and `end` must be integers."}, status=HTTP_400_BAD_REQUEST)
         ancestors_query = Q("nested", path="ancestors", query=Q("match", ancestors__identifier=pk))
-
-        self.search.query = ancestors_query
-        data["total"] = self.search.count()
-
-        self.search.query = (ancestors_query & self.get_structured_query()
-                             if self.request.GET.get(settings.REST_FRAMEWORK["SEARCH_PARAM"])
-                             else ancestors_query)
-
-        for result in self.filter_queryset(self.search).source(["position", "uri", "title", "online"]).scan():
-            data["hits"].append({
-                "index": result.position,
-                "uri": f"{result.uri.rstrip('/')}",
-                "title": result.title,
-                "online": result.online})
+        search = self.get_minimap_search(ancestors_query)
+        source_fields = ["position", "uri", "title", "online"]
+        if request.GET.get("compact") == "true":
+            layout = self.get_minimap_layout(ancestors_query)
+            hits = scan_raw(search.source(["parent", "position", "online"]))
+            return Response(minimap_bitsets(layout.total, (
+                (layout.ordinal(hit["_source"].get("parent"), hit["_source"].get("position"), hit["_id"]),
+                 hit["_source"].get("online", False)) for hit in hits)))
+        if request.GET.get("start") or end is not None:
+            layout = self.get_minimap_layout(ancestors_query)
+            total = layout.total
+            end = total if end is None else min(end, total)
+            results = iter(())
+            if start < end:
+                ranged = search.query(layout.range_query(start, end))
+                results = (dict(hit["_source"], position=layout.ordinal(
+                    hit["_source"].get("parent"), hit["_source"]["position"], hit["_id"])) for hit in scan_raw(
+                        ranged.source(source_fields + ["parent"]).sort(*MINIMAP_SORT).params(preserve_order=True)))
+        else:
+            descendants = self.search.query()
+            descendants.query = ancestors_query
+            total = descendants.count()
+            results = (hit["_source"] for hit in scan_raw(search.source(source_fields)))
+        if request.GET.get("stream") == "true":
+            return StreamingHttpResponse(stream_minimap(total, results), content_type="application/json")
+        data = {"hits": [minimap_hit(result) for result in results], "total": total}
         return Response(data)
 
 
@@ -397,20 +753,27 @@ class SearchView(DocumentViewSet):
         queryset = (self.search.extra(collapse=collapse_params).query(self.get_structured_query())
                     if self.request.GET.get(settings.REST_FRAMEWORK["SEARCH_PARAM"])
                     else self.search.extra(collapse=collapse_params).query())
+        source_fields = self.get_source_fields()
+        if source_fields:
+            queryset = queryset.source(source_fields + ["group.identifier"])
         return queryset.exclude('terms', type=['term'])
 
+    @cache_response
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
         """Overrides default `list` behavior to add `hit_count` and `online_hit_count` attributes."""
         if page is not None:
-            for p in page:
-                p.hit_count, p.online_hit_count = self.get_hit_counts(p.group.identifier, queryset)
+            hit_counts = self.get_aggregated_hit_counts([p.group.identifier for p in page], queryset)
+            for p, (hit_count, online_hit_count) in zip(page, hit_counts):
+                p.hit_count, p.online_hit_count = hit_count, online_hit_count
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-        for q in queryset:
-            q.hit_count, q.online_hit_count = self.get_hit_counts(q.uri, queryset)
-        serializer = self.get_serializer(queryset, many=True)
+        results = list(queryset)
+        hit_counts = self.get_aggregated_hit_counts([r.uri for r in results], queryset)
+        for r, (hit_count, online_hit_count) in zip(results, hit_counts):
+            r.hit_count, r.online_hit_count = hit_count, online_hit_count
+        serializer = self.get_serializer(results, many=True)
         return Response(serializer.data)
 
     @action(detail=False)
@@ -448,6 +811,7 @@ class FacetView(SearchView):
                 if self.request.GET.get(settings.REST_FRAMEWORK["SEARCH_PARAM"])
                 else self.search.extra(size=0))
 
+    @cache_response
     def retrieve(self, request, *args, **kwargs):
         results = self.get_queryset().execute()
         serializer = self.get_serializer(results)
@@ -460,33 +824,79 @@ class MyListView(SearchMixin, ObjectResolverMixin, APIView):
     Takes a list of URIs, resolves saved items, and groups them by collection.
     """
 
+    item_source_fields = {
+        "title": ["title"],
+        "uri": ["uri"],
+        "dates": ["dates"],
+        "description": ["notes"],
+        "extents": ["extents"],
+        "notes": ["notes"],
+        "parent": ["ancestors"],
+        "parent_ref": ["ancestors"],
+        "archivesspace_uri": ["external_identifiers"],
+    }
+
     def post(self, request, format=None):
-        list = request.data.get("list", [])
-        resp = []
-        resolved_list = []
-        for uri in list:
+        fields = self.get_requested_fields()
+        saved, identifiers = self.get_saved_identifiers(request.data.get("list", []))
+        resolved = {}
+        for object_type, idents in identifiers.items():
+            resolved.update(self.get_resolved_items(
+                object_type, idents, self.resolve_objects(object_type, idents, source_fields=self.get_source_fields(fields), raw=True)))
+        return Response(self.group_items(saved, resolved, fields))
+
+    def get_requested_fields(self):
+        """Returns a list of item fields requested in the `fields` parameter, or all item fields if none were requested.
+
+        Raises ParseError if any of the fields are not item fields.
+        """
+        fields = [f.strip() for f in self.request.GET.get("fields", "").split(",") if f.strip()]
+        invalid_fields = set(fields) - set(self.item_source_fields)
+        if invalid_fields:
+            raise ParseError("Invalid fields: {}.".format(", ".join(sorted(invalid_fields))))
+        return fields or list(self.item_source_fields)
+
+    def get_source_fields(self, fields):
+        """Returns the `_source` fields needed for item fields, and to group items by collection."""
+        return sorted({"group", "uri"}.union(*[self.item_source_fields[f] for f in fields]))
+
+    def get_saved_identifiers(self, uris):
+        """Returns a list of tuples of object type and identifier for saved URIs, and the identifiers of each type."""
+        saved = []
+        identifiers = {Collection: [], Object: []}
+        for uri in uris:
             object_type, ident, *rest = uri.lstrip("/").split("/")
-            try:
-                resolved = self.resolve_object(Collection if object_type == "collection" else Object, ident,
-                                               source_fields=["ancestors", "title", "uri", "dates", "extents",
-                                                              "group", "notes", "external_identifiers"])
-                resolved_list.append(resolved)
-            except Http404:
-                pass  # missing objects are ignored
-        collection_titles = set(map(lambda x: x.group.title, resolved_list))
-        for title in collection_titles:
-            collection_objects = [obj.to_dict() for obj in resolved_list if obj.group.title == title]
-            items = [
-                {
-                    "title": obj["title"],
-                    "uri": f'{obj["uri"].rstrip("/")}',
-                    "dates": date_string(obj.get("dates", [])),
-                    "description": description_from_notes(obj.get("notes", [])),
-                    "extents": obj.get("extents"),
-                    "notes": [note for note in obj.get("notes", []) if note["type"] in ["scopecontent", "abstract"]],
-                    "parent": obj["ancestors"][0]["title"],
-                    "parent_ref": f'/collections/{obj["ancestors"][0]["identifier"].rstrip("/")}',
-                    "archivesspace_uri": [ident["identifier"] for ident in obj["external_identifiers"] if ident["source"] == "archivesspace"][0]
-                } for obj in collection_objects]
-            resp.append({"title": title, "items": items})
-        return Response(resp)
+            object_type = Collection if object_type == "collection" else Object
+            saved.append((object_type, ident))
+            identifiers[object_type].append(ident)
+        return saved, identifiers
+
+    def get_resolved_items(self, object_type, identifiers, objects):
+        """Returns a dict of resolved objects keyed by object type and identifier, ignoring missing objects."""
+        return {(object_type, ident): obj for ident, obj in zip(identifiers, objects) if obj is not None}
+
+    def group_items(self, saved, resolved, fields):
+        """Returns data for saved items grouped by collection, in the order they were saved."""
+        groups = {}
+        for key in saved:
+            hit = resolved.get(key)
+            if hit is None:
+                continue
+            groups.setdefault(hit["_source"]["group"]["title"], []).append(self.get_item(hit, fields))
+        return [{"title": title, "items": items} for title, items in groups.items()]
+
+    def get_item(self, hit, fields):
+        """Returns data for a saved item, limited to `fields`."""
+        version, obj = document_version(hit), hit["_source"]
+        values = {
+            "title": lambda: obj["title"],
+            "uri": lambda: f'{obj["uri"].rstrip("/")}',
+            "dates": lambda: cached_date_string(version, obj),
+            "description": lambda: cached_description(version, obj),
+            "extents": lambda: obj.get("extents"),
+            "notes": lambda: [note for note in obj.get("notes", []) if note["type"] in ["scopecontent", "abstract"]],
+            "parent": lambda: obj["ancestors"][0]["title"],
+            "parent_ref": lambda: f'/collections/{obj["ancestors"][0]["identifier"].rstrip("/")}',
+            "archivesspace_uri": lambda: [ident["identifier"] for ident in obj["external_identifiers"] if ident["source"] == "archivesspace"][0],
+        }
+        return {name: value() for name, value in values.items() if name in fields}
@@ -0,0 +1,32 @@
+"""
+ASGI config for argo project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are routed by ``ASGI_URLCONF`` rather than ``ROOT_URLCONF``, so that
+async versions of views are used where they exist.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "argo.settings")
+
+
+class URLConfASGIHandler(ASGIHandler):
+    """ASGI handler which routes requests with `ASGI_URLCONF`."""
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = settings.ASGI_URLCONF
+        return request, error_response
+
+
+django.setup(set_prefix=False)
+application = URLConfASGIHandler()
@@ -0,0 +1,27 @@
+"""argo URL Configuration for the ASGI application
+
+Routes for views with async versions are matched before the routes in
+`argo.urls`, which serve all other requests.
+"""
+from django.urls import include, path, re_path
+from rest_framework.urlpatterns import format_suffix_patterns
+
+from api_formatter.async_views import (AsyncCollectionViewSet, AsyncMyListView,
+                                       AsyncObjectViewSet)
+
+async_urlpatterns = format_suffix_patterns([
+    re_path(r'^collections/(?P<pk>[^/.]+)/ancestors$',
+            AsyncCollectionViewSet.as_async_view({'get': 'ancestors'}, basename='collection', detail=True),
+            name='collection-ancestors'),
+    re_path(r'^collections/(?P<pk>[^/.]+)/children$',
+            AsyncCollectionViewSet.as_async_view({'get': 'children'}, basename='collection', detail=True),
+            name='collection-children'),
+    re_path(r'^objects/(?P<pk>[^/.]+)/ancestors$',
+            AsyncObjectViewSet.as_async_view({'get': 'ancestors'}, basename='object', detail=True),
+            name='object-ancestors'),
+])
+
+urlpatterns = async_urlpatterns + [
+    path('mylist', AsyncMyListView.as_async_view({'post': 'post'}), name='mylist'),
+    path('', include('argo.urls')),
+]
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 
 import os
 
+from api_formatter.instrumentation import InstrumentedConnection
+
 from . import config
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -57,6 +59,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'csp.middleware.CSPMiddleware',
+    'api_formatter.metrics.MetricsMiddleware',
+    'api_formatter.instrumentation.ElasticsearchInstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'argo.urls'
@@ -79,6 +83,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'argo.wsgi.application'
 
+# Routes used by the ASGI application in argo/asgi.py, which include async views
+ASGI_URLCONF = 'argo.asgi_urls'
+
 
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
@@ -144,15 +151,55 @@ REST_FRAMEWORK = {
     'ORDERING_PARAM': 'sort',
 }
 
-# Elasticsearch configuration
+# Cache configuration
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            "MAX_ENTRIES": 1000,
+        },
+    }
+}
+
+# Elasticsearch configuration; cursor pagination requires Elasticsearch 7.12 or
+# later, for points in time sorted on `_shard_doc`
 ELASTICSEARCH_DSL = {
     "default": {
         "hosts": config.ELASTICSEARCH_HOSTS,
         "index": config.ELASTICSEARCH_INDEX,
-        "connection": config.ELASTICSEARCH_CONNECTION
+        "connection": config.ELASTICSEARCH_CONNECTION,
+        "connection_class": InstrumentedConnection,
     }
 }
 
+# Included in ETags, so that clients revalidate cached responses; increase when a
+# deployment changes the content of responses
+RESPONSE_VERSION = 1
+
+# Requests slower than this log the body of each Elasticsearch request (None to disable)
+ELASTICSEARCH_SLOW_REQUEST_MS = 1000
+
+# Maximum connections to each Elasticsearch node from async views in each ASGI process
+ELASTICSEARCH_ASYNC_CONNECTIONS = 100
+
+# Client addresses allowed to scrape /metrics; behind a reverse proxy, this is
+# the address of the proxy, which should not forward requests for /metrics
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "api_formatter.instrumentation": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
 # CORS settings
 CORS_ORIGIN_ALLOW_ALL = True
 
@@ -16,11 +16,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from api_formatter.metrics import metrics_view
 from api_formatter.views import MyListView
 
 urlpatterns = [
     path('admin', admin.site.urls),
     path('mylist', MyListView.as_view(), name='mylist'),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('api_formatter.urls'))
 
 ]